@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from utils.get_data import *
+from utils.Neural_Network import *
+
+# Throughput benchmarks of the training and inference code on the Monk and
+# CUP workloads, with fixed seeds. Run from the repository root:
+#   python src/benchmark.py --output Benchmark/baseline.json
+#   python src/benchmark.py --compare Benchmark/baseline.json
+# Every time is the best of --repeat runs.
+
+WIDTHS = [20, 35, 50]
+DEPTHS = [1, 2]
+SEED = 4
+
+# metrics where a larger value is better, all the others are times or memory
+THROUGHPUT = ["train_samples_per_sec", "train_epochs_per_sec", "predict_rows_per_sec", "network_output_rows_per_sec"]
+
+# training and validation data of every workload, the Monk test set being
+# the validation data of its grid search
+def load_workloads():
+    monk_training, monk_test = get_data_monk(1, True)
+    cup_training, cup_validation, _ = hold_out_cup(0.5, 0.25)
+    return {
+        "monk": (monk_training, monk_test, False, False, [Relu(), Sigmoid()], 0.1),
+        "cup": (cup_training, cup_validation, True, True, [Tanh(), Id()], 0.7)
+    }
+
+def build_network(data, activations, weight_range, depth, width, backend):
+    np.random.seed(SEED)
+    outputs = targets(data[1]).shape[1]
+    activations = [activations[0]] * depth + [activations[-1]]
+    return Network(weight_range, depth, data[0].shape[1], [width] * depth + [outputs], activations, SEED, backend=backend)
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def benchmark_network(data, regression, standardization, activations, weight_range, depth, width, epochs, repeat, backend):
+    network = build_network(data, activations, weight_range, depth, width, backend)
+    network.set_reset()
+
+    def train():
+        network.reset()
+        network.backpropagation_batch(data, regression, True, standardization, 0, epochs, 0.05, 0.0001, 0.5)
+
+    train_time = best_time(train, repeat)
+    network.reset()
+    tracemalloc.start()
+    network.backpropagation_batch(data, regression, True, standardization, 0, epochs, 0.05, 0.0001, 0.5)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    X = np.asarray(data[0], dtype=float)
+    predict_time = best_time(lambda: network.predict(X), repeat)
+    rows = X[:100]
+    network_output_time = best_time(lambda: [network.network_output(row) for row in rows], repeat)
+    return {
+        "train_seconds": train_time,
+        "train_epochs_per_sec": epochs / train_time,
+        "train_samples_per_sec": epochs * len(X) / train_time,
+        "train_peak_memory_bytes": peak_memory,
+        "predict_rows_per_sec": len(X) / predict_time,
+        "network_output_rows_per_sec": len(rows) / network_output_time
+    }
+
+# Network.internal_grid_search over a 3 x 3 x 3 grid, the search that
+# grid_search runs for every network in its worker processes, one
+# combination at a time and stacked
+def benchmark_grid_search(data, validation_data, regression, standardization, activations, weight_range, epochs, repeat, backend):
+    network = build_network(data, activations, weight_range, 2, 20, backend)
+    # the search saves the curves of its best combination under the seed of
+    # the network, which must not overwrite those of a trial
+    network.seed = "Benchmark"
+    ranges = [[0.02, 0.05, 0.08], [10**-2, 10**-3, 10**-4], [0.7, 0.55, 0.4]]
+
+    def search(stacked):
+        network.internal_grid_search(data, validation_data, regression, True, standardization, 0, epochs, *ranges, False, stacked=stacked)
+        network.reset()
+
+    return {
+        "grid_search_sequential_seconds": best_time(lambda: search(False), repeat),
+        "grid_search_stacked_seconds": best_time(lambda: search(True), repeat)
+    }
+
+def run(epochs, repeat, backend = "numpy"):
+    results = {}
+    for name, (data, validation_data, regression, standardization, activations, weight_range) in load_workloads().items():
+        for depth in DEPTHS:
+            for width in WIDTHS:
+                key = f"{name}_depth{depth}_width{width}"
+                results[key] = benchmark_network(data, regression, standardization, activations, weight_range, depth, width, epochs, repeat, backend)
+                print(key, {metric: round(value, 4) for metric, value in results[key].items()})
+        results[name + "_grid_search"] = benchmark_grid_search(data, validation_data, regression, standardization, activations, weight_range, epochs, repeat, backend)
+        print(name + "_grid_search", {metric: round(value, 4) for metric, value in results[name + "_grid_search"].items()})
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "epochs": epochs,
+            "repeat": repeat,
+            "seed": SEED,
+            "backend": backend
+        },
+        "results": results
+    }
+
+# Returns the metrics that got worse than the baseline by more than threshold.
+def compare(baseline, current, threshold):
+    regressions = []
+    for workload, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            reference = baseline["results"].get(workload, {}).get(metric)
+            if reference is None or reference == 0:
+                continue
+            change = value / reference - 1
+            worse = change < -threshold if metric in THROUGHPUT else change > threshold
+            print(f"{'REGRESSION' if worse else 'ok':10} {workload:25} {metric:32} {reference:14.4f} -> {value:14.4f} ({change:+.1%})")
+            if worse:
+                regressions.append((workload, metric, reference, value))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", help="file where the results are written as JSON")
+    parser.add_argument("--compare", help="baseline JSON file to compare the results with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported as a regression")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", default="numpy", help="compute backend of the networks: numpy or numba")
+    args = parser.parse_args()
+
+    current = run(args.epochs, args.repeat, args.backend)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.threshold):
+            sys.exit(1)
@@ -1,44 +1,34 @@
 from utils.get_data import *
 from utils.Neural_Network import *
+from utils.checkpoint import *
+from utils.inference import *
+from utils.results import ResultStore
 
 def find_final_model(seed):
 
-    with open("trials.txt", "r") as f:
-        lines = f.readlines()
+    if checkpoint_exists(str(seed) + "_retrained"):
+        return load_checkpoint(str(seed) + "_retrained")
 
-    lines = iter(lines)
+    record = ResultStore().trial(seed)
+    if record is None:
+        raise KeyError(f"no trial of seed {seed} in the results")
 
-    network = None
-    activation_functions = []
-    params = []
-
-    for line in lines:
-        if line.startswith("seed:"):  
-            current_seed = int(line.split()[1])
-            if current_seed == seed:
-                next_line = next(lines)
-                network_str = next_line.split("network:")[1].split("activation_function:")[0].strip()
-                network = eval(network_str)
-                
-                activation_function_str = next_line.split("activation_function:")[1].split("params:")[0].strip()
-                activation_functions = [eval(x)() for x in eval(activation_function_str)]
-
-                break
+    network = record["network"]
+    activation_functions = [get_activation(x) for x in record["activation_class"]]
 
     network = Network(0.7, len(network) - 1, 12, network, activation_functions, seed)
     network.load_weights(str(seed) + "_retrained")
     return network
 
 def compute_result(seed):
-    X = get_blind_TS()
     network = find_final_model(seed)
-    with open("Newtork_ML-CUP24-TS.csv", "w") as f:
-        f.write("# Tommaso Crocetti, Pietro Lorenzo Bianchi\n")
-        f.write("# Newtork\n")
-        f.write("# ML-CUP24 v1\n")
-        f.write("# 07/01/2025\n")
-        for i in range(len(X)):
-            f.write(f"{i + 1}," + ",".join(map(str, network.network_output(X.iloc[i]))) + "\n")
+    header = ["# Tommaso Crocetti, Pietro Lorenzo Bianchi", "# Newtork", "# ML-CUP24 v1", "# 07/01/2025"]
+    predict_csv(freeze(network), "Dataset/Cup/ML-CUP24-TS.csv", "Newtork_ML-CUP24-TS.csv", header)
+
+def compute_ensemble_result(seeds):
+    ensemble = Ensemble([find_final_model(seed) for seed in seeds])
+    header = ["# Tommaso Crocetti, Pietro Lorenzo Bianchi", "# Newtork", "# ML-CUP24 v1", "# 07/01/2025"]
+    predict_csv(ensemble, "Dataset/Cup/ML-CUP24-TS.csv", "Newtork_ML-CUP24-TS.csv", header)
 
 if __name__ == "__main__":
     # randomly chosen seed for blind test set
@@ -1,5 +1,6 @@
 from utils.get_data import *
 from utils.Neural_Network import *
+from utils.plot import *
 import time
 
 def monk_trial(id, seed, show = True):
@@ -1,32 +1,16 @@
 from trial import *
+from utils.results import ResultStore
+from utils.curves import render_in_background
 from concurrent.futures import ProcessPoolExecutor, as_completed, wait
 import time
 
 def compute_mean_var(seeds):
 
-    tr_results, val_results, ts_results = [], [], []
+    mean_var = ResultStore().mean_var(seeds)
 
-    with open("trials.txt", "r") as file:
-        lines = file.readlines()
-
-    for line in lines:
-        if line.startswith("seed:"):  
-            try:
-                seed = int(line.split()[1])
-                if seed in seeds:
-                    training_error = float(line.split("training_error:")[1].split()[0])
-                    validation_error = float(line.split("validation_error:")[1].split()[0])
-                    test_error = float(line.split("test_error:")[1].split()[0])
-                    tr_results.append(training_error)
-                    val_results.append(validation_error)
-                    ts_results.append(test_error)
-                    seeds.remove(seed)
-            except Exception as e:
-                print(f"Errore nell'estrazione degli errori: {e}")
-
-    tr_mean, tr_var = np.mean(tr_results), np.var(tr_results)
-    val_mean, val_var = np.mean(val_results), np.var(val_results)
-    ts_mean, ts_var = np.mean(ts_results), np.var(ts_results)
+    tr_mean, tr_var = mean_var["training"]
+    val_mean, val_var = mean_var["validation"]
+    ts_mean, ts_var = mean_var["test"]
 
     print(f"Training - Media: {tr_mean:.4f}, Varianza: {tr_var:.4f}")
     print(f"Validation - Media: {val_mean:.4f}, Varianza: {val_var:.4f}")
@@ -65,16 +49,10 @@ def multiple_trials(seeds):
 
     results_sorted = sorted(results, key=lambda x: x["seed"])
 
-    with open("trials.txt", "a") as f:
-        for res in results_sorted:
-            f.write(
-                f"\n\nseed: {res['seed']}\ttraining_error: {res['training_error']}\t"
-                f"validation_error: {res['validation_error']}\ttest_error: {res['test_error']}\n"
-            )
-            f.write(
-                f"network: {res['network']}\tactivation_function: {res['activation_class']}\t"
-                f"params: {res['params']}\n"
-            )
+    ResultStore().add_trials(results_sorted)
+
+    # the workers only stored the learning curves of their trials
+    render_in_background()
 
     end = time.time()
     print(f"({seeds}) Total elapsed time: {round((end - start) / 60, 2)} minutes")
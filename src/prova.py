@@ -1,5 +1,6 @@
 from utils.get_data import *
 from utils.Neural_Network import *
+from utils.plot import *
 
 training_data, validation_data, test_data = hold_out_cup(0.5, 0.25)
 
@@ -0,0 +1,12 @@
+import argparse
+from utils.curves import *
+
+# Draws the learning curves stored during training, run from the repository root:
+#   python src/render_plots.py
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--force", action="store_true", help="redraw the figures that are already up to date")
+    args = parser.parse_args()
+
+    os.environ["HEADLESS"] = "1"
+    print(f"Rendered {render_curves(CURVES, args.force)} figures")
@@ -0,0 +1,43 @@
+import argparse
+from utils.work_queue import *
+
+# Grid search sweeps through a job queue, run from the repository root.
+# Coordinator, with 8 workers on this host:
+#   python src/sweep.py run --queue Sweeps/queue.db --workers 8
+# Extra workers on other hosts sharing the repository folder:
+#   python src/sweep.py worker --queue Sweeps/queue.db
+
+SETTINGS = {
+    "data": ["hold_out_cup", [0.5, 0.25]],
+    "weight_range": 0.7,
+    "regression": True,
+    "mean": True,
+    "standardization": True,
+    "tollerance": 0.01,
+    "max_epochs": 500,
+    "optimizer": "Nesterov"
+}
+
+ARCHITECTURES = [([width, width, 3], ["Tanh", "Tanh", "Id"]) for width in [20, 35, 50]]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["run", "worker"])
+    parser.add_argument("--queue", default="Sweeps/queue.db")
+    parser.add_argument("--name", default="cup", help="name of the sweep, running it again resumes it")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes started by run on this host")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[4])
+    parser.add_argument("--epochs", type=int, default=SETTINGS["max_epochs"])
+    parser.add_argument("--lease", type=float, default=60, help="seconds after which the job of a silent worker is requeued")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.queue) or ".", exist_ok=True)
+    if args.command == "worker":
+        print(f"Completed {run_worker(args.queue, lease_seconds=args.lease)} jobs")
+    else:
+        settings = dict(SETTINGS, max_epochs=args.epochs)
+        start = time.time()
+        results = run_sweep(args.queue, args.name, settings, ARCHITECTURES, args.seeds, [0.02, 0.05, 0.08], [10**-2, 10**-3, 10**-4], [0.7, 0.55, 0.4], args.workers, lease_seconds=args.lease)
+        for job, result in results[:5]:
+            print(f"({job['seed']}) Validation error: {result['validation_error']:.4f}, Training error: {result['training_error']:.4f}, net: {job['layers']}, params: {job['eta'], job['lambda_tichonov'], job['alpha']}")
+        print(f"Sweep elapsed time: {round((time.time() - start) / 60, 2)} minutes")
@@ -1,5 +1,8 @@
 from utils.get_data import *
 from utils.grid_search import *
+from utils.checkpoint import *
+from utils.result_cache import *
+from utils.curves import *
 
 def trial(seed, show = False):
 
@@ -17,7 +20,7 @@ def trial(seed, show = False):
 
     start = time.time()
 
-    network, params, validation_error = grid_search([network0_20, network0_35, network0_50], training_data, validation_data, True, True, True, 0.01, 500, [0.02, 0.05, 0.08], [10**-2, 10**-3, 10**-4], [0.7, 0.55, 0.4], ["20", "35", "50"])
+    network, params, validation_error = grid_search([network0_20, network0_35, network0_50], training_data, validation_data, True, True, True, 0.01, 500, [0.02, 0.05, 0.08], [10**-2, 10**-3, 10**-4], [0.7, 0.55, 0.4], ["20", "35", "50"], ResultCache())
 
     network.set_reset()
 
@@ -37,12 +40,12 @@ def trial(seed, show = False):
     
     end = time.time()
 
-    network.save_net(str(seed))
+    save_checkpoint(network, str(seed))
 
     print(f"({seed}) Test error: {task_test_error[-1]}, test elapsed time: {(end - start) // 60} minutes")
 
-    plot_error(training_error, test_error, "Test", "Test", "Seed_" + str(seed) + "_Test_MSE", True, show)
-    plot_error(task_training_error, task_test_error, "Test", "Test", "Seed_" + str(seed) + "_Test_MEE", True, show)
+    show_or_save_curves(training_error, test_error, "Test", "Test", "Seed_" + str(seed) + "_Test_MSE", show)
+    show_or_save_curves(task_training_error, task_test_error, "Test", "Test", "Seed_" + str(seed) + "_Test_MEE", show)
     
     result["test_error"] = round(task_test_error[-1], 4)
 
@@ -56,12 +59,12 @@ def trial(seed, show = False):
 
     end = time.time()
 
-    network.save_net(str(seed) + "_retrained")
+    save_checkpoint(network, str(seed) + "_retrained")
 
     print(f"({seed}) Training error: {task_training_error[-1]}, train elapsed time: {(end - start) // 60} minutes")
 
-    plot_error(training_error, None, None, "Train", "Seed_" + str(seed) + "_Train_MSE", True, show)
-    plot_error(task_training_error, None, None, "Train", "Seed_" + str(seed) + "_Train_MEE", True, show)
+    show_or_save_curves(training_error, None, None, "Train", "Seed_" + str(seed) + "_Train_MSE", show)
+    show_or_save_curves(task_training_error, None, None, "Train", "Seed_" + str(seed) + "_Train_MEE", show)
 
     result["training_error"] = round(training_error[-1], 4)
 
@@ -1,13 +1,21 @@
 from abc import ABC, abstractmethod
 from enum import Enum
-from utils.plot import *
+import numpy as np
+from utils.callbacks import *
+from utils.optimizers import *
+from utils.backends import *
+from utils.categorical import Categorical
+from utils.curves import save_curves
 
 class Function(ABC):
     
+    # activations and derivatives write into buffer when one is given
     @abstractmethod
     def activation(self):
         pass
     
+    # derivatives are computed from the values saved by the forward pass:
+    # net is the pre-activation and out the activation of the layer
     @abstractmethod
     def derivate(self):
         pass
@@ -15,12 +23,18 @@ class Function(ABC):
 class Id(Function):
 
     @staticmethod
-    def id(x):
-        return x
+    def id(x, buffer = None):
+        if buffer is None:
+            return x
+        np.copyto(buffer, x)
+        return buffer
 
     @staticmethod
-    def id_der(x):
-        return 1
+    def id_der(net, out, buffer = None):
+        if buffer is None:
+            return np.ones_like(net)
+        buffer.fill(1)
+        return buffer
 
     def activation(self):
         return self.id
@@ -31,12 +45,12 @@ class Id(Function):
 class Relu(Function):
 
     @staticmethod
-    def relu(x):
-        return np.maximum(x, 0)
+    def relu(x, buffer = None):
+        return np.maximum(x, 0, out=buffer)
 
     @staticmethod
-    def relu_der(x):
-        return 1 if x > 0 else 0
+    def relu_der(net, out, buffer = None):
+        return np.heaviside(net, 0, out=buffer)
 
     def activation(self):
         return self.relu
@@ -49,12 +63,17 @@ class Sigmoid(Function):
     a = 1
 
     @staticmethod
-    def sigmoid(x):
-        return 1 / (1 + np.exp(-(Sigmoid.a * x)))
+    def sigmoid(x, buffer = None):
+        buffer = np.multiply(x, -Sigmoid.a, out=buffer)
+        np.exp(buffer, out=buffer)
+        buffer += 1
+        return np.reciprocal(buffer, out=buffer)
     
     @staticmethod
-    def sigmoid_der(x):
-        return Sigmoid.sigmoid(x)*(1-Sigmoid.sigmoid(x))
+    def sigmoid_der(net, out, buffer = None):
+        buffer = np.subtract(1, out, out=buffer)
+        buffer *= out
+        return buffer
     
     def activation(self):
         return Sigmoid.sigmoid
@@ -67,12 +86,16 @@ class Tanh(Function):
     a = 1
 
     @staticmethod
-    def tanh(x):
-        return np.tanh(Tanh.a * x / 2)
+    def tanh(x, buffer = None):
+        buffer = np.multiply(x, Tanh.a / 2, out=buffer)
+        return np.tanh(buffer, out=buffer)
 
     @staticmethod
-    def tanh_der(x):
-        return Tanh.a * (1 - np.tanh(Tanh.a * x / 2) ** 2)/2
+    def tanh_der(net, out, buffer = None):
+        buffer = np.square(out, out=buffer)
+        np.subtract(1, buffer, out=buffer)
+        buffer *= Tanh.a / 2
+        return buffer
 
     def activation(self):
         return Tanh.tanh
@@ -80,6 +103,54 @@ class Tanh(Function):
     def derivate(self):
         return Tanh.tanh_der
 
+activations = {function.__name__: function for function in (Id, Relu, Sigmoid, Tanh)}
+
+def get_activation(name):
+    return activations[name]()
+
+def add_bias(o):
+    if o.ndim == 1:
+        return np.concatenate((np.ones(1, dtype=o.dtype), o))
+    return np.vstack((np.ones((1, o.shape[1]), dtype=o.dtype), o))
+
+def inputs(X):
+    return X if isinstance(X, Categorical) else np.asarray(X, dtype=float)
+
+def targets(y):
+    y = np.asarray(y, dtype=float)
+    return y.reshape(len(y), -1)
+
+# metrics over the last two axes (samples, outputs), so that a stack of
+# outputs of shape (configurations, samples, outputs) gives one value each
+def mean_squared_error(y, output):
+    return np.mean(np.sum((y - output) ** 2, axis=-1), axis=-1)
+
+def mean_euclidean_error(y, output):
+    return np.mean(np.sqrt(np.sum((y - output) ** 2, axis=-1)), axis=-1)
+
+def loss_0_1(y, output, threshold, positive = 1, negative = 0):
+    discrete_output = np.where(output >= threshold, positive, negative)
+    return np.sum((y - discrete_output) ** 2, axis=(-2, -1))
+
+def accuracy(y, output, threshold = 0.5):
+    l = y.shape[-2]
+    return (l - loss_0_1(y, output, threshold)) / l
+
+def stop_training(MSE_errors, tollerance):
+    if len(MSE_errors) > 1:
+        return MSE_errors[-1] > 10**4 or np.abs((MSE_errors[-2] - MSE_errors[-1])/ MSE_errors[-2]) * 100 < tollerance
+    return False
+
+def mini_batches(X, y, batch_size = None, rng = None):
+    l = len(X)
+    if batch_size is None or batch_size >= l:
+        yield X, y
+        return
+    order = rng.permutation(l) if rng is not None else np.arange(l)
+    for start in range(0, l, batch_size):
+        indexes = order[start:start + batch_size]
+        yield X[indexes], y[indexes]
+
 class Type(Enum):
     INPUT = 1
     HIDDEN = 2
@@ -87,45 +158,96 @@ class Type(Enum):
 
 class Layer:
 
-    def __init__(self, neurons, weights, activation_class, layer_type, weight_range = 0.7):
+    def __init__(self, neurons, weights, activation_class, layer_type, weight_range = 0.7, dtype = np.float64):
         self.neurons = neurons
         self.type = layer_type
+        self.activation_class = activation_class
         self.activation_function = activation_class.activation()
         self.activation_derivate = activation_class.derivate()
         if layer_type == Type.INPUT:
             self.weights = weights
-            self.weight_matrix = np.eye(neurons)
+            self.weight_matrix = np.eye(neurons, dtype=dtype)
         else:
             self.weights = weights + 1
-            self.weight_matrix = (np.random.uniform(-weight_range, weight_range, (self.neurons, self.weights)))
+            self.weight_matrix = (np.random.uniform(-weight_range, weight_range, (self.neurons, self.weights))).astype(dtype)
+
+    # the values of the last forward pass are views on a workspace's buffers,
+    # which are not pickled with the network
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("net_value", None)
+        state.pop("output", None)
+        return state
 
     def net(self, o):
         if self.type != Type.INPUT:
-            o = np.concatenate((np.array([1]), o))
+            o = add_bias(o)
         return np.dot(self.weight_matrix, o)
 
     def act(self, o):
-        f = np.vectorize(self.activation_function)
-        return f(self.net(o))
-
-    def der_act(self, o):
-        f = np.vectorize(self.activation_derivate)
-        return f(self.net(o))
+        return self.activation_function(self.net(o))
+
+    def forward(self, o):
+        self.net_value = self.net(o)
+        self.output = self.activation_function(self.net_value)
+        return self.output
+
+    def forward_into(self, biased_input, net_value, output):
+        np.matmul(self.weight_matrix, biased_input, out=net_value)
+        self.net_value = net_value
+        self.output = self.activation_function(net_value, output)
+        return self.output
+
+    # forward pass from categorical codes, gathering the weight columns
+    def forward_codes(self, X, net_value, output):
+        self.net_value = X.net(self.weight_matrix, net_value)
+        self.output = self.activation_function(net_value, output)
+        return self.output
+
+    def der_act(self, buffer = None):
+        return self.activation_derivate(self.net_value, self.output, buffer)
+
+# Buffers of the passes over a batch of samples. A forward-only workspace, as
+# used by predict, has no buffers for the backward pass and the update.
+class Workspace:
+
+    def __init__(self, layers, samples, dtype, training = True):
+        self.samples = samples
+        # inputs[i] is the input of layers[i] with the bias row on top: the
+        # output of every hidden layer is a view on the next layer's input
+        self.inputs = []
+        for layer in layers:
+            biased_input = np.empty((layer.weights, samples), dtype=dtype)
+            biased_input[0] = 1
+            self.inputs.append(biased_input)
+        self.outputs = [biased_input[1:] for biased_input in self.inputs[1:]]
+        self.outputs.append(np.empty((layers[-1].neurons, samples), dtype=dtype))
+        self.net_values = [np.empty((layer.neurons, samples), dtype=dtype) for layer in layers]
+        if not training:
+            return
+        self.derivates = [np.empty((layer.neurons, samples), dtype=dtype) for layer in layers]
+        self.deltas = [np.empty((layer.neurons, samples), dtype=dtype) for layer in layers]
+        self.gradients = [np.empty(layer.weight_matrix.shape, dtype=dtype) for layer in layers]
+        self.decays = [np.empty(layer.weight_matrix.shape, dtype=dtype) for layer in layers]
 
 class Network:
 
-    def __init__(self, weight_range, hidden_layers_number, input_dimension, layer_length, activation_class_arr, seed = ""):
+    # forward-only workspaces kept for predict, the most recently created ones
+    forward_workspaces_kept = 2
+
+    def __init__(self, weight_range, hidden_layers_number, input_dimension, layer_length, activation_class_arr, seed = "", dtype = np.float64, backend = "numpy"):
         self.depth = hidden_layers_number
+        self.dtype = np.dtype(dtype)
         self.activation_class_arr = activation_class_arr
-        self.input_layer = Layer(input_dimension, input_dimension, Id(), Type.INPUT)
+        self.input_layer = Layer(input_dimension, input_dimension, Id(), Type.INPUT, dtype=dtype)
         self.hidden_layers = np.empty(self.depth, dtype=object)
         self.store_hidden_result = []
-        self.hidden_layers[0] = Layer(layer_length[0], input_dimension, activation_class_arr[0], Type.HIDDEN, weight_range)
+        self.hidden_layers[0] = Layer(layer_length[0], input_dimension, activation_class_arr[0], Type.HIDDEN, weight_range, dtype)
         self.store_hidden_result.append(np.zeros(self.hidden_layers[0].neurons))
         for i in range(1, hidden_layers_number):
-            self.hidden_layers[i] = Layer(layer_length[i], self.hidden_layers[i - 1].neurons, activation_class_arr[i], Type.HIDDEN, weight_range)
+            self.hidden_layers[i] = Layer(layer_length[i], self.hidden_layers[i - 1].neurons, activation_class_arr[i], Type.HIDDEN, weight_range, dtype)
             self.store_hidden_result.append(np.zeros(self.hidden_layers[i].neurons))
-        self.output_layer = Layer(layer_length[-1], self.hidden_layers[-1].neurons, activation_class_arr[-1], Type.OUTPUT, weight_range)
+        self.output_layer = Layer(layer_length[-1], self.hidden_layers[-1].neurons, activation_class_arr[-1], Type.OUTPUT, weight_range, dtype)
         self.std_mean = {
             "X_mean": 0,
             "X_std": 1,
@@ -133,6 +255,42 @@ class Network:
             "y_std": 1
         }
         self.seed = seed
+        self.workspaces = {}
+        self.forward_workspaces = {}
+        self.timer = None
+        self.backend = get_backend(backend)
+
+    def trainable_layers(self):
+        return list(self.hidden_layers) + [self.output_layer]
+
+    # the workspaces are buffers, not part of the network: they are left out
+    # when it is pickled for the worker processes or checkpointed
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["workspaces"] = {}
+        state["forward_workspaces"] = {}
+        return state
+
+    def workspace(self, samples):
+        if samples not in self.workspaces:
+            self.forward_workspaces.pop(samples, None)
+            self.workspaces[samples] = Workspace(self.trainable_layers(), samples, self.dtype)
+        return self.workspaces[samples]
+
+    # the training workspace of that size if there is one, otherwise one of
+    # the forward-only workspaces, of which only the latest are kept
+    def forward_workspace(self, samples):
+        if samples in self.workspaces:
+            return self.workspaces[samples]
+        if samples not in self.forward_workspaces:
+            while len(self.forward_workspaces) >= self.forward_workspaces_kept:
+                del self.forward_workspaces[next(iter(self.forward_workspaces))]
+            self.forward_workspaces[samples] = Workspace(self.trainable_layers(), samples, self.dtype, False)
+        return self.forward_workspaces[samples]
+
+    def set_weights(self, weights):
+        for layer, weight_matrix in zip(self.trainable_layers(), weights):
+            layer.weight_matrix = np.ascontiguousarray(weight_matrix)
 
     def set_reset(self):
         self.reset_hidden_layers = []
@@ -147,176 +305,410 @@ class Network:
 
     def train_network_output(self, input):
         current_input = self.input_layer.act(input)
-        self.store_hidden_result[0] = self.hidden_layers[0].act(current_input)
+        self.store_hidden_result[0] = self.hidden_layers[0].forward(current_input)
+        for i in range(self.depth-1):
+            self.store_hidden_result[i + 1] = self.hidden_layers[i + 1].forward(self.store_hidden_result[i])
+        return self.output_layer.forward(self.store_hidden_result[self.depth - 1])
+
+    def train_batch_output(self, X, workspace = None):
+        if workspace is not None:
+            if isinstance(X, Categorical):
+                self.hidden_layers[0].forward_codes(X, workspace.net_values[0], workspace.outputs[0])
+                return self.backend.forward(self.trainable_layers(), workspace, 1)
+            np.copyto(workspace.inputs[0][1:], X.T)
+            return self.backend.forward(self.trainable_layers(), workspace)
+        self.store_hidden_result[0] = self.hidden_layers[0].forward(X.T)
         for i in range(self.depth-1):
-            self.store_hidden_result[i + 1] = self.hidden_layers[i + 1].act(self.store_hidden_result[i])
-        return self.output_layer.act(self.store_hidden_result[self.depth - 1])
+            self.store_hidden_result[i + 1] = self.hidden_layers[i + 1].forward(self.store_hidden_result[i])
+        return self.output_layer.forward(self.store_hidden_result[self.depth - 1])
 
     def network_output(self, input):
-        input = (input - self.std_mean["X_mean"]) / self.std_mean["X_std"]
-        output = self.train_network_output(input)
-        return output * self.std_mean["y_std"] + self.std_mean["y_mean"]
+        return self.predict(input)[0]
+
+    # the forward pass runs on the backend in a workspace of the input's size,
+    # whose output is copied by the de-standardization; categorical inputs are
+    # not standardized
+    def predict(self, X):
+        if not isinstance(X, Categorical):
+            X = np.atleast_2d(np.asarray(X, dtype=self.dtype))
+            X = (X - np.asarray(self.std_mean["X_mean"], dtype=self.dtype)) / np.asarray(self.std_mean["X_std"], dtype=self.dtype)
+        output = self.train_batch_output(X, self.forward_workspace(len(X))).T
+        return output * np.asarray(self.std_mean["y_std"], dtype=self.dtype) + np.asarray(self.std_mean["y_mean"], dtype=self.dtype)
 
     def Loss_0_1(self, X, y, threshold, positive = 1, negative = 0):
-        error = 0
-        for i in range(len(X)):
-            output = self.network_output(X.iloc[i])
-            if output >= threshold:
-                discrete_output = positive
-            else:
-                discrete_output = negative
-            target_value = y.iloc[i]
-            error += ((target_value - discrete_output))**2
-        return error
+        return loss_0_1(targets(y), self.predict(X), threshold, positive, negative)
     
     def Accuracy(self, X, y, threshold = 0.5):
-        l = len(X)
-        misclassified = self.Loss_0_1(X, y, threshold)
-        return  ((l - misclassified) / l)
+        return accuracy(targets(y), self.predict(X), threshold)
 
     def MSE(self, X, y):
-        error = 0
-        for i in range(len(X)):
-            output = self.network_output(X.iloc[i])
-            error += np.dot(y.iloc[i] - output, y.iloc[i] - output)
-        return error / len(X)
+        return mean_squared_error(targets(y), self.predict(X))
     
     def MEE(self, X, y):
-        error = 0
-        for i in range(len(X)):
-            output = self.network_output(X.iloc[i])
-            error += np.sqrt(np.dot((y.iloc[i] - output), (y.iloc[i] - output)))
-        return error / len(X)
-
-    def backpropagation_batch(self, training_data, regression, mean, standardization, tollerance, max_epochs, eta, lambda_tichonov, alpha, other_data = None):
-        X = training_data[0]
-        y = training_data[1]
-        l = len(X)
-        if mean:
-            eta = eta / l
+        return mean_euclidean_error(targets(y), self.predict(X))
+
+    def prepare_data(self, training_data, standardization, other_data = None):
+        X = inputs(training_data[0])
+        y = targets(training_data[1])
+        if other_data:
+            other_data = [inputs(other_data[0]), targets(other_data[1])]
         if standardization:
-            self.std_mean["X_mean"] = X.mean()
-            self.std_mean["X_std"] = X.std()
-            self.std_mean["y_mean"] = y.mean()
-            self.std_mean["y_std"] = y.std()
-        X_std = (X - self.std_mean["X_mean"]) / self.std_mean["X_std"]
-        y_std = (y - self.std_mean["y_mean"]) / self.std_mean["y_std"]
-        error_function = self.MEE if regression else self.Accuracy
-        task_errors = []
-        MSE_errors = []
-        task_other_errors = []
-        MSE_other_errors = []
-        batch_gradient = [[np.zeros((self.hidden_layers[i].neurons, self.hidden_layers[i].weights)) for i in range(self.depth)]for i in range(2)]
-        batch_gradient[0].append(np.zeros((self.output_layer.neurons, self.output_layer.weights)))
-        batch_gradient[1].append(np.zeros((self.output_layer.neurons, self.output_layer.weights)))
-        old_batch_gradient = [np.zeros((self.hidden_layers[i].neurons, self.hidden_layers[i].weights)) for i in range(self.depth)] ###
-        old_batch_gradient.append(np.zeros((self.output_layer.neurons, self.output_layer.weights))) ###
-        for i in range(max_epochs):
-            task_errors.append(error_function(X, y))
-            MSE_errors.append(self.MSE(X, y))
+            # one-hot inputs kept as codes are not standardized
+            self.std_mean["X_mean"] = 0 if isinstance(X, Categorical) else X.mean(axis=0)
+            self.std_mean["X_std"] = 1 if isinstance(X, Categorical) else X.std(axis=0, ddof=1)
+            self.std_mean["y_mean"] = y.mean(axis=0)
+            self.std_mean["y_std"] = y.std(axis=0, ddof=1)
+        X_std = X if isinstance(X, Categorical) else ((X - self.std_mean["X_mean"]) / self.std_mean["X_std"]).astype(self.dtype)
+        y_std = ((y - self.std_mean["y_mean"]) / self.std_mean["y_std"]).astype(self.dtype)
+        return X, y, X_std, y_std, other_data
+
+    # With fused_metrics the training errors of an epoch are accumulated by the
+    # forward passes of its gradient steps instead of an extra pass over the
+    # training set: they are then measured at the look-ahead weights (and,
+    # with mini-batches, while the weights change). Validation errors are only
+    # computed every evaluation_interval epochs, repeating the last value in
+    # between, and always on the last epoch.
+    def backpropagation_batch(self, training_data, regression, mean, standardization, tollerance, max_epochs, eta, lambda_tichonov, alpha, other_data = None, batch_size = None, state = None, fused_metrics = False, evaluation_interval = 1, callbacks = None, optimizer = Nesterov):
+        X, y, X_std, y_std, other_data = self.prepare_data(training_data, standardization, other_data)
+        l = len(X)
+        error_function = mean_euclidean_error if regression else accuracy
+        # a state dictionary keeps the optimizer, the shuffling rng and the errors
+        # between calls, so that training can be resumed up to a larger max_epochs
+        if state is None:
+            state = {}
+        if "errors" not in state:
+            state["errors"] = ([], [], [], [])
+            state["optimizer"] = optimizer([layer.weight_matrix for layer in self.trainable_layers()])
+            state["rng"] = np.random.default_rng(self.seed if isinstance(self.seed, int) else None)
+            state["stopped"] = False
+            state["evaluated"] = True
+        MSE_errors, MSE_other_errors, task_errors, task_other_errors = state["errors"]
+        optimizer = state["optimizer"]
+        rng = state["rng"]
+        callbacks = callbacks or []
+        for callback in callbacks:
+            callback.on_train_begin(self)
+        self.timer = Timer() if callbacks else None
+        reason = None
+        for i in range(len(MSE_errors), max_epochs):
+            if state["stopped"]:
+                break
+            reason = "max_epochs"
+            if self.timer:
+                self.timer.start()
+            for callback in callbacks:
+                callback.on_epoch_start(self, i)
+            if not fused_metrics:
+                output = self.predict(X)
+                task_errors.append(error_function(y, output))
+                MSE_errors.append(mean_squared_error(y, output))
             if other_data:
-                task_other_errors.append(error_function(other_data[0], other_data[1]))
-                MSE_other_errors.append(self.MSE(other_data[0], other_data[1]))
-            if len(MSE_errors) > 1:
-                if MSE_errors[-1] > 10**4:
+                state["evaluated"] = i % evaluation_interval == 0 or i == max_epochs - 1 or not MSE_other_errors
+                if state["evaluated"]:
+                    other_output = self.predict(other_data[0])
+                    task_other_errors.append(error_function(other_data[1], other_output))
+                    MSE_other_errors.append(mean_squared_error(other_data[1], other_output))
+                else:
+                    task_other_errors.append(task_other_errors[-1])
+                    MSE_other_errors.append(MSE_other_errors[-1])
+            if self.timer:
+                self.timer.lap("evaluation")
+            if not fused_metrics and stop_training(MSE_errors, tollerance):
+                state["stopped"] = True
+                reason = "diverged" if MSE_errors[-1] > 10**4 else "converged"
+                break
+            metrics = {"squared_error": 0, "euclidean_error": 0, "misclassified": 0} if fused_metrics else None
+            for batch, (X_batch, y_batch) in enumerate(mini_batches(X_std, y_std, batch_size, rng)):
+                batch_eta = eta / len(X_batch) if mean and not optimizer.normalized else eta
+                # the penalty is spread over the mini-batches so that an epoch applies it once
+                batch_lambda_tichonov = lambda_tichonov * len(X_batch) / l
+                self.gradient_step(X_batch, y_batch, batch_eta, batch_lambda_tichonov, alpha, optimizer, metrics)
+                for callback in callbacks:
+                    callback.on_batch(self, i, batch, len(X_batch))
+            if fused_metrics:
+                task_errors.append(metrics["euclidean_error"] / l if regression else (l - metrics["misclassified"]) / l)
+                MSE_errors.append(metrics["squared_error"] / l)
+            if callbacks:
+                logs = {"MSE": MSE_errors[-1], "task": task_errors[-1]}
+                if other_data:
+                    logs.update(MSE_other=MSE_other_errors[-1], task_other=task_other_errors[-1])
+                logs.update(times=dict(self.timer.times), epoch_time=self.timer.total())
+                if any([callback.on_epoch_end(self, i, logs) for callback in callbacks]):
+                    state["stopped"] = True
+                    reason = "callback"
                     break
-                if np.abs((MSE_errors[-2] - MSE_errors[-1])/ MSE_errors[-2]) * 100 < tollerance:
-                    break
-            for i in range(self.depth):
-                batch_gradient[1][i] = lambda_tichonov * self.hidden_layers[i].weight_matrix
-                self.hidden_layers[i].weight_matrix += alpha * old_batch_gradient[i]
-            batch_gradient[1][-1] = lambda_tichonov * self.output_layer.weight_matrix
-            self.output_layer.weight_matrix += alpha * old_batch_gradient[-1]
-            batch_gradient[0] = self.backpropagation_iteration(X_std.iloc[0], y_std.iloc[0])
-            for i in range(1, l):
-                current_gradient = self.backpropagation_iteration(X_std.iloc[i], y_std.iloc[i])
-                batch_gradient[0] = [batch_gradient[0][i] + current_gradient[i] for i in range(self.depth + 1)]
-            for i in range(self.depth):
-                batch_gradient[0][i] *= eta 
-                self.hidden_layers[i].weight_matrix += (batch_gradient[0][i] - batch_gradient[1][i])
-                old_batch_gradient[i] = alpha * old_batch_gradient[i] + batch_gradient[0][i]
-            batch_gradient[0][-1] *= eta 
-            self.output_layer.weight_matrix += (batch_gradient[0][-1] - batch_gradient[1][-1])
-            old_batch_gradient[-1] = alpha * old_batch_gradient[-1] + batch_gradient[0][-1]
+            if fused_metrics and stop_training(MSE_errors, tollerance):
+                state["stopped"] = True
+                reason = "diverged" if MSE_errors[-1] > 10**4 else "converged"
+                break
+        if other_data and not state["evaluated"]:
+            other_output = self.predict(other_data[0])
+            task_other_errors[-1] = error_function(other_data[1], other_output)
+            MSE_other_errors[-1] = mean_squared_error(other_data[1], other_output)
+            state["evaluated"] = True
+        if reason:
+            for callback in callbacks:
+                callback.on_stop(self, len(MSE_errors) - 1, reason)
+        self.timer = None
 
         return (MSE_errors, MSE_other_errors, task_errors, task_other_errors) if other_data else (MSE_errors, task_errors)
+
+    # Tichonov decay is taken from the weights before the optimizer moves them.
+    # A backend that fuses the optimizer runs the whole step itself, which the
+    # timer charges to the backward phase.
+    def gradient_step(self, X, y, eta, lambda_tichonov, alpha, optimizer, metrics = None):
+        workspace = self.workspace(len(X))
+        if not isinstance(X, Categorical) and self.backend.fuses(optimizer):
+            np.copyto(workspace.inputs[0][1:], X.T)
+            output = self.backend.step(self.trainable_layers(), workspace, y, eta, lambda_tichonov, alpha, optimizer)
+            if self.timer:
+                self.timer.lap("backward")
+            if metrics is not None:
+                self.accumulate_metrics(metrics, y.T - output, output)
+                if self.timer:
+                    self.timer.lap("evaluation")
+            return
+        weights = [layer.weight_matrix for layer in self.trainable_layers()]
+        for i, weight_matrix in enumerate(weights):
+            np.multiply(weight_matrix, lambda_tichonov, out=workspace.decays[i])
+        optimizer.look_ahead(weights, alpha)
+        if self.timer:
+            self.timer.lap("update")
+        batch_gradient = self.backpropagation_full_batch(X, y, metrics)
+        optimizer.update(weights, batch_gradient, eta, alpha)
+        for i, weight_matrix in enumerate(weights):
+            weight_matrix -= workspace.decays[i]
+        if self.timer:
+            self.timer.lap("update")
+
+    # adds the errors of a batch to metrics from the standardized residual
+    # (target - output) and output of the training forward pass
+    def accumulate_metrics(self, metrics, residual, output):
+        y_scale = np.asarray(self.std_mean["y_std"], dtype=self.dtype).reshape(-1, 1)
+        squared_error = np.sum((residual * y_scale) ** 2, axis=0)
+        metrics["squared_error"] += squared_error.sum()
+        metrics["euclidean_error"] += np.sqrt(squared_error).sum()
+        output = output * y_scale + np.asarray(self.std_mean["y_mean"], dtype=self.dtype).reshape(-1, 1)
+        metrics["misclassified"] += loss_0_1(output + residual * y_scale, output, 0.5)
           
     def backpropagation_iteration(self, x, y):
         output = self.train_network_output(x)
         store_gradient = []
-        current_layer_delta = np.zeros(self.output_layer.neurons)
-        current_layer_der = self.output_layer.der_act(self.store_hidden_result[-1])
+        current_layer_der = self.output_layer.der_act()
         updated_hidden_result = np.concatenate((np.array([1]), self.store_hidden_result[self.depth - 1]))
         current_layer_delta = (y - output) * current_layer_der
         store_gradient.append(np.outer(current_layer_delta, updated_hidden_result))
         next_layer_delta = current_layer_delta
         if (self.depth == 1):
             current_layer = self.hidden_layers[0]
-            current_layer_delta = np.zeros(current_layer.neurons)
-            current_layer_der = current_layer.der_act(x)
+            current_layer_der = current_layer.der_act()
             updated_hidden_result = np.concatenate((np.array([1]), x))
-            for index_neuron in range(current_layer.neurons):
-                current_layer_delta[index_neuron] = np.dot(next_layer_delta, self.output_layer.weight_matrix[:,index_neuron + 1]) * current_layer_der[index_neuron]
+            current_layer_delta = np.dot(self.output_layer.weight_matrix[:, 1:].T, next_layer_delta) * current_layer_der
             store_gradient.append(np.outer(current_layer_delta, updated_hidden_result))
             store_gradient.reverse()
             return store_gradient
         current_layer = self.hidden_layers[-1]
-        current_layer_delta = np.zeros(current_layer.neurons)
-        current_layer_der = current_layer.der_act(self.store_hidden_result[-2])
+        current_layer_der = current_layer.der_act()
         updated_hidden_result = np.concatenate((np.array([1]), self.store_hidden_result[-2]))
-        for index_neuron in range(current_layer.neurons):
-            current_layer_delta[index_neuron] = np.dot(next_layer_delta, self.output_layer.weight_matrix[:,index_neuron + 1]) * current_layer_der[index_neuron]
+        current_layer_delta = np.dot(self.output_layer.weight_matrix[:, 1:].T, next_layer_delta) * current_layer_der
         store_gradient.append(np.outer(current_layer_delta, updated_hidden_result))
         next_layer_delta = current_layer_delta
         for hidden_layer_index in range(self.depth - 2, 0, -1):
             current_layer = self.hidden_layers[hidden_layer_index]
-            current_layer_delta = np.zeros(current_layer.neurons)
-            current_layer_der = current_layer.der_act(self.store_hidden_result[hidden_layer_index - 1])
+            current_layer_der = current_layer.der_act()
             updated_hidden_result = np.concatenate((np.array([1]), self.store_hidden_result[hidden_layer_index - 1]))
-            for index_neuron in range(current_layer.neurons):
-                current_layer_delta[index_neuron] = np.dot(next_layer_delta, self.hidden_layers[hidden_layer_index + 1].weight_matrix[:,index_neuron + 1]) * current_layer_der[index_neuron]
+            current_layer_delta = np.dot(self.hidden_layers[hidden_layer_index + 1].weight_matrix[:, 1:].T, next_layer_delta) * current_layer_der
             store_gradient.append(np.outer(current_layer_delta, updated_hidden_result))
             next_layer_delta = current_layer_delta
         current_layer = self.hidden_layers[0]
-        current_layer_delta = np.zeros(current_layer.neurons)
-        current_layer_der = current_layer.der_act(x)
+        current_layer_der = current_layer.der_act()
         updated_hidden_result = np.concatenate((np.array([1]), x))
-        for index_neuron in range(current_layer.neurons):
-            current_layer_delta[index_neuron] = np.dot(next_layer_delta, self.hidden_layers[1].weight_matrix[:,index_neuron + 1]) * current_layer_der[index_neuron]
+        current_layer_delta = np.dot(self.hidden_layers[1].weight_matrix[:, 1:].T, next_layer_delta) * current_layer_der
         store_gradient.append(np.outer(current_layer_delta, updated_hidden_result))
         store_gradient.reverse()
         return store_gradient
     
-    def internal_grid_search(self, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_tichonov_range, alpha_range, save):
+    def backpropagation_full_batch(self, X, y, metrics = None):
+        workspace = self.workspace(len(X))
+        layers = self.trainable_layers()
+        output = self.train_batch_output(X, workspace)
+        if self.timer:
+            self.timer.lap("forward")
+        np.subtract(y.T, output, out=workspace.deltas[-1])
+        if metrics is not None:
+            self.accumulate_metrics(metrics, workspace.deltas[-1], output)
+            if self.timer:
+                self.timer.lap("evaluation")
+        if isinstance(X, Categorical):
+            gradients = self.backend.backward(layers, workspace, False)
+            X.gradient(workspace.deltas[0], gradients[0])
+        else:
+            gradients = self.backend.backward(layers, workspace)
+        if self.timer:
+            self.timer.lap("backward")
+        return gradients
+
+    # Forward pass of K configurations at once: weights holds one (K, out, in)
+    # array per layer and the result is the (K, out, samples) output together
+    # with the biased inputs, pre-activations and activations of every layer.
+    def stacked_output(self, weights, X_std):
+        current_input = add_bias(X_std.T)
+        inputs, net_values, outputs = [], [], []
+        for layer, weight_matrix in zip(self.trainable_layers(), weights):
+            net_value = np.matmul(weight_matrix, current_input)
+            output = layer.activation_function(net_value)
+            inputs.append(current_input)
+            net_values.append(net_value)
+            outputs.append(output)
+            current_input = np.concatenate((np.ones((output.shape[0], 1, output.shape[2]), dtype=self.dtype), output), axis=1)
+        return outputs[-1], (inputs, net_values, outputs)
+
+    def stacked_predict(self, weights, X):
+        X_std = ((X - np.asarray(self.std_mean["X_mean"])) / np.asarray(self.std_mean["X_std"])).astype(self.dtype)
+        output = self.stacked_output(weights, X_std)[0].transpose(0, 2, 1)
+        return output * np.asarray(self.std_mean["y_std"], dtype=self.dtype) + np.asarray(self.std_mean["y_mean"], dtype=self.dtype)
+
+    def stacked_gradient(self, weights, X, y):
+        layers = self.trainable_layers()
+        output, (inputs, net_values, outputs) = self.stacked_output(weights, X)
+        gradients = [None] * len(layers)
+        delta = (y.T - output) * layers[-1].activation_derivate(net_values[-1], outputs[-1])
+        gradients[-1] = np.matmul(delta, inputs[-1].swapaxes(-1, -2))
+        for i in range(self.depth - 1, -1, -1):
+            delta = np.matmul(weights[i + 1][:, :, 1:].swapaxes(1, 2), delta) * layers[i].activation_derivate(net_values[i], outputs[i])
+            gradients[i] = np.matmul(delta, inputs[i].swapaxes(-1, -2))
+        return gradients
+
+    # Trains one configuration per [eta, lambda_tichonov, alpha] in combinations
+    # from the current weights, all of them in the same batched matmuls.
+    # Configurations that meet a stop condition are dropped from the stack.
+    # Returns the same errors backpropagation_batch returns for each of them.
+    def backpropagation_stacked(self, training_data, regression, mean, standardization, tollerance, max_epochs, combinations, other_data = None, batch_size = None, optimizer = Nesterov):
+        X, y, X_std, y_std, other_data = self.prepare_data(training_data, standardization, other_data)
+        # the stacked passes work on dense inputs, categorical codes are expanded
+        X, X_std = np.asarray(X, dtype=float), np.asarray(X_std, dtype=self.dtype)
+        if other_data:
+            other_data[0] = np.asarray(other_data[0], dtype=float)
+        l = len(X)
+        error_function = mean_euclidean_error if regression else accuracy
+        rng = np.random.default_rng(self.seed if isinstance(self.seed, int) else None)
+        parameters = np.array(combinations, dtype=self.dtype).reshape(-1, 3, 1, 1)
+        eta, lambda_tichonov, alpha = parameters[:, 0], parameters[:, 1], parameters[:, 2]
+        weights = [np.repeat(layer.weight_matrix[np.newaxis], len(combinations), axis=0) for layer in self.trainable_layers()]
+        optimizer = optimizer(weights)
+        errors = [([], [], [], []) for _ in combinations]
+        active = np.arange(len(combinations))
+        for i in range(max_epochs):
+            output = self.stacked_predict(weights, X)
+            task_error = error_function(y, output)
+            MSE_error = mean_squared_error(y, output)
+            if other_data:
+                other_output = self.stacked_predict(weights, other_data[0])
+                task_other_error = error_function(other_data[1], other_output)
+                MSE_other_error = mean_squared_error(other_data[1], other_output)
+            keep = np.ones(len(active), dtype=bool)
+            for k, index in enumerate(active):
+                MSE_errors, MSE_other_errors, task_errors, task_other_errors = errors[index]
+                task_errors.append(task_error[k])
+                MSE_errors.append(MSE_error[k])
+                if other_data:
+                    task_other_errors.append(task_other_error[k])
+                    MSE_other_errors.append(MSE_other_error[k])
+                if stop_training(MSE_errors, tollerance):
+                    keep[k] = False
+            if not keep.all():
+                active = active[keep]
+                weights = [weight_matrix[keep] for weight_matrix in weights]
+                optimizer.select(keep)
+                eta, lambda_tichonov, alpha = eta[keep], lambda_tichonov[keep], alpha[keep]
+            if len(active) == 0:
+                break
+            for X_batch, y_batch in mini_batches(X_std, y_std, batch_size, rng):
+                batch_eta = eta / len(X_batch) if mean and not optimizer.normalized else eta
+                batch_lambda_tichonov = lambda_tichonov * len(X_batch) / l
+                decays = [batch_lambda_tichonov * weight_matrix for weight_matrix in weights]
+                optimizer.look_ahead(weights, alpha)
+                batch_gradient = self.stacked_gradient(weights, X_batch, y_batch)
+                optimizer.update(weights, batch_gradient, batch_eta, alpha)
+                for j in range(len(weights)):
+                    weights[j] -= decays[j]
+        return [error if other_data else (error[0], error[2]) for error in errors]
+
+    def internal_grid_search(self, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_tichonov_range, alpha_range, save, batch_size = None, cache = None, min_epochs = None, reduction = 3, stacked = False, fused_metrics = False, evaluation_interval = 1, optimizer = Nesterov):
+        if min_epochs:
+            if cache:
+                raise ValueError("successive halving (min_epochs) does not use the result cache")
+            return self.successive_halving(training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_tichonov_range, alpha_range, save, batch_size, min_epochs, reduction, fused_metrics, evaluation_interval, optimizer)
         best_comb = -1
         best_model = [0, 0, 0]
         best_t_l = []
         best_t_t = []
         best_v_l = []
         best_v_t = [np.inf]
-        counter = 0
         self.set_reset()
-        for current_eta in eta_range:
-            for current_lambda_tichonov in lambda_tichonov_range:
-                for current_alpha in alpha_range:
-                    loss_t_error, loss_v_error, task_t_error, task_v_error = self.backpropagation_batch(training_data, regression, mean, standardization, tollerance, max_epochs, current_eta, current_lambda_tichonov, current_alpha, validation_data)
-                    if save:
-                        plot_error(loss_t_error, loss_v_error, "Validation", "Validation", "Seed_" + str(self.seed) + "_" + str(self.hidden_layers[0].neurons) + "_" + str(current_eta) + "_" + str(current_lambda_tichonov) + "_" + str(current_alpha) + "_Validation_MSE", save, False)
-                        plot_error(task_t_error, task_v_error, "Validation", "Validation", "Seed_" + str(self.seed) + "_" + str(self.hidden_layers[0].neurons) + "_" + str(current_eta) + "_" + str(current_lambda_tichonov) + "_" + str(current_alpha) + "_Validation_MEE", save, False)
-                        print(f"({self.seed}) Validation error: {task_v_error[-1]}, Training error: {task_t_error[-1]}, net: {[self.hidden_layers[i].neurons for i in range(self.depth)]}, params: {current_eta, current_lambda_tichonov, current_alpha}")
-                    if task_v_error[-1] < best_v_t[-1]:
-                        best_comb = counter
-                        best_model = [current_eta, current_lambda_tichonov, current_alpha]
-                        best_t_l = loss_t_error
-                        best_t_t = task_t_error
-                        best_v_l = loss_v_error
-                        best_v_t = task_v_error
-                    counter += 1
-                    self.reset()
-        plot_error(best_t_l, best_v_l, "Validation", "Validation", "Seed_" + str(self.seed) + "_Validation_MSE", True, False)
-        plot_error(best_t_t, best_v_t, "Validation", "Validation", "Seed_" + str(self.seed) + "_Validation_MEE", True, False)
+        combinations = [[current_eta, current_lambda_tichonov, current_alpha] for current_eta in eta_range for current_lambda_tichonov in lambda_tichonov_range for current_alpha in alpha_range]
+        results = [None] * len(combinations)
+        if cache:
+            digest = cache.digest(self, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, batch_size, fused_metrics and not stacked, 1 if stacked else evaluation_interval, optimizer.__name__)
+            keys = [cache.key(digest, *combination) for combination in combinations]
+            results = [cache.get(key) for key in keys]
+        missing = [counter for counter in range(len(combinations)) if results[counter] is None]
+        if stacked and missing:
+            stacked_results = self.backpropagation_stacked(training_data, regression, mean, standardization, tollerance, max_epochs, [combinations[counter] for counter in missing], validation_data, batch_size, optimizer)
+        for i, counter in enumerate(missing):
+            if stacked:
+                results[counter] = stacked_results[i]
+            else:
+                results[counter] = self.backpropagation_batch(training_data, regression, mean, standardization, tollerance, max_epochs, *combinations[counter], validation_data, batch_size, None, fused_metrics, evaluation_interval, None, optimizer)
+                self.reset()
+            if cache:
+                cache.put(keys[counter], results[counter])
+        for counter, (current_eta, current_lambda_tichonov, current_alpha) in enumerate(combinations):
+            loss_t_error, loss_v_error, task_t_error, task_v_error = results[counter]
+            if save:
+                save_curves(loss_t_error, loss_v_error, "Validation", "Validation", "Seed_" + str(self.seed) + "_" + str(self.hidden_layers[0].neurons) + "_" + str(current_eta) + "_" + str(current_lambda_tichonov) + "_" + str(current_alpha) + "_Validation_MSE")
+                save_curves(task_t_error, task_v_error, "Validation", "Validation", "Seed_" + str(self.seed) + "_" + str(self.hidden_layers[0].neurons) + "_" + str(current_eta) + "_" + str(current_lambda_tichonov) + "_" + str(current_alpha) + "_Validation_MEE")
+                print(f"({self.seed}) Validation error: {task_v_error[-1]}, Training error: {task_t_error[-1]}, net: {[self.hidden_layers[i].neurons for i in range(self.depth)]}, params: {current_eta, current_lambda_tichonov, current_alpha}")
+            if task_v_error[-1] < best_v_t[-1]:
+                best_comb = counter
+                best_model = [current_eta, current_lambda_tichonov, current_alpha]
+                best_t_l = loss_t_error
+                best_t_t = task_t_error
+                best_v_l = loss_v_error
+                best_v_t = task_v_error
+        save_curves(best_t_l, best_v_l, "Validation", "Validation", "Seed_" + str(self.seed) + "_Validation_MSE")
+        save_curves(best_t_t, best_v_t, "Validation", "Validation", "Seed_" + str(self.seed) + "_Validation_MEE")
         return [best_comb, best_model, np.round(best_v_t[-1], 4), np.round(best_t_t[-1], 4)]
 
+    # Trains every combination for min_epochs, keeps the best 1 / reduction of
+    # them by validation error (accuracy in classification) and resumes only those, with their own weights
+    # and optimizer state, for reduction times more epochs, until max_epochs.
+    def successive_halving(self, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_tichonov_range, alpha_range, save, batch_size = None, min_epochs = 50, reduction = 3, fused_metrics = False, evaluation_interval = 1, optimizer = Nesterov):
+        self.set_reset()
+        combinations = [[current_eta, current_lambda_tichonov, current_alpha] for current_eta in eta_range for current_lambda_tichonov in lambda_tichonov_range for current_alpha in alpha_range]
+        states = [{"weights": [np.copy(weights) for weights in self.reset_hidden_layers] + [np.copy(self.reset_output_layer)]} for _ in combinations]
+        survivors = list(range(len(combinations)))
+        epochs = min(min_epochs, max_epochs)
+        while True:
+            for index in survivors:
+                self.set_weights(states[index]["weights"])
+                self.backpropagation_batch(training_data, regression, mean, standardization, tollerance, epochs, *combinations[index], validation_data, batch_size, states[index], fused_metrics, evaluation_interval, None, optimizer)
+            sign = 1 if regression else -1
+            survivors.sort(key=lambda index: sign * states[index]["errors"][3][-1])
+            if epochs >= max_epochs:
+                break
+            survivors = survivors[:max(1, len(survivors) // reduction)]
+            epochs = max_epochs if len(survivors) == 1 else min(epochs * reduction, max_epochs)
+        if save:
+            for index in survivors:
+                print(f"({self.seed}) Validation error: {states[index]['errors'][3][-1]}, Training error: {states[index]['errors'][2][-1]}, net: {[self.hidden_layers[i].neurons for i in range(self.depth)]}, params: {tuple(combinations[index])}")
+        best_comb = survivors[0]
+        loss_t_error, loss_v_error, task_t_error, task_v_error = states[best_comb]["errors"]
+        self.reset()
+        save_curves(loss_t_error, loss_v_error, "Validation", "Validation", "Seed_" + str(self.seed) + "_Validation_MSE")
+        save_curves(task_t_error, task_v_error, "Validation", "Validation", "Seed_" + str(self.seed) + "_Validation_MEE")
+        return [best_comb, combinations[best_comb], np.round(task_v_error[-1], 4), np.round(task_t_error[-1], 4)]
+
     def save_net(self, filename):
         with open("Weights/" + filename + ".txt", "w") as f:
             for i, layer in enumerate(self.hidden_layers):
@@ -356,7 +748,7 @@ class Network:
                 line = next(lines)
                 self.std_mean["y_std"] = [float(x) for x in line.split()]
             elif not line.strip():
-                current_layer.weight_matrix = np.array(current_layer_weights)
+                current_layer.weight_matrix = np.array(current_layer_weights, dtype=self.dtype)
                 current_layer_weights = []
             else:
                 current_layer_weights.append([float(x) for x in line.split()])
@@ -0,0 +1,144 @@
+from abc import ABC, abstractmethod
+import numpy as np
+from utils.optimizers import Nesterov, Momentum
+
+# Kernels of the full-batch training pass. Both work on a Workspace: forward
+# reads the biased input of the first layer from workspace.inputs[0] and fills
+# the pre-activations and outputs of every layer, backward starts from the
+# residual (target - output) in workspace.deltas[-1] and fills the deltas and
+# the gradients. When the network computes the first layer itself (from
+# categorical codes) forward starts from the second layer and backward leaves
+# the gradient of the first one to the network.
+class Backend(ABC):
+
+    @abstractmethod
+    def forward(self, layers, workspace, start = 0):
+        pass
+
+    @abstractmethod
+    def backward(self, layers, workspace, input_gradient = True):
+        pass
+
+    # True if step runs whole training steps of this optimizer
+    def fuses(self, optimizer):
+        return False
+
+    # One training step on the dense batch in workspace.inputs[0] with targets
+    # y (samples, outputs): Tichonov decay, look-ahead, forward and backward
+    # passes and update, leaving the output in workspace.outputs[-1].
+    def step(self, layers, workspace, y, eta, lambda_tichonov, alpha, optimizer):
+        raise NotImplementedError
+
+class NumpyBackend(Backend):
+
+    def forward(self, layers, workspace, start = 0):
+        for i, layer in enumerate(layers[start:], start):
+            layer.forward_into(workspace.inputs[i], workspace.net_values[i], workspace.outputs[i])
+        return workspace.outputs[-1]
+
+    def backward(self, layers, workspace, input_gradient = True):
+        workspace.deltas[-1] *= layers[-1].der_act(workspace.derivates[-1])
+        np.matmul(workspace.deltas[-1], workspace.inputs[-1].T, out=workspace.gradients[-1])
+        for i in range(len(layers) - 2, -1, -1):
+            np.matmul(layers[i + 1].weight_matrix[:, 1:].T, workspace.deltas[i + 1], out=workspace.deltas[i])
+            workspace.deltas[i] *= layers[i].der_act(workspace.derivates[i])
+            if i > 0 or input_gradient:
+                np.matmul(workspace.deltas[i], workspace.inputs[i].T, out=workspace.gradients[i])
+        return workspace.gradients
+
+# JIT compiled kernels that run the backward pass over all the layers in one
+# call, and with Nesterov or Momentum the update too. The forward pass is the
+# NumPy one, whose exp and tanh are vectorized: compiled by numba they are
+# scalar libm calls, several times slower.
+# Needs numba, which is only imported when the backend is created; the module
+# is kept in a global rather than on the instance so that networks can still
+# be pickled for the worker processes.
+numba_kernels = None
+
+def load_numba_kernels():
+    global numba_kernels
+    if numba_kernels is None:
+        from utils import numba_kernels
+    return numba_kernels
+
+class NumbaBackend(NumpyBackend):
+
+    def __init__(self):
+        load_numba_kernels()
+        self.activation_arrays = {}
+
+    @property
+    def kernels(self):
+        return load_numba_kernels()
+
+    # the kernels take every layer's arrays as one tuple, which must be C
+    # contiguous: the network builds and loads its weights that way
+    def weights(self, layers):
+        for layer in layers:
+            if not layer.weight_matrix.flags.c_contiguous:
+                raise ValueError("the numba backend needs C contiguous weight matrices")
+        return tuple(layer.weight_matrix for layer in layers)
+
+    # activation codes and slopes of the layers, built once per configuration
+    def activations(self, layers):
+        key = tuple((type(layer.activation_class).__name__, float(getattr(layer.activation_class, "a", 1))) for layer in layers)
+        if key not in self.activation_arrays:
+            self.activation_arrays[key] = (np.array([self.kernels.ACTIVATION_CODES[name] for name, _ in key]), np.array([a for _, a in key]))
+        return self.activation_arrays[key]
+
+    def backward(self, layers, workspace, input_gradient = True):
+        self.kernels.backward(self.weights(layers), tuple(workspace.inputs), tuple(workspace.net_values), tuple(workspace.outputs), tuple(workspace.deltas), tuple(workspace.gradients), *self.activations(layers), input_gradient)
+        return workspace.gradients
+
+    def fuses(self, optimizer):
+        return type(optimizer) in (Nesterov, Momentum)
+
+    # the look-ahead and the update run in the kernels around the forward pass
+    def step(self, layers, workspace, y, eta, lambda_tichonov, alpha, optimizer):
+        weights, velocities, decays = self.weights(layers), tuple(optimizer.state["velocity"]), tuple(workspace.decays)
+        nesterov = type(optimizer) is Nesterov
+        self.kernels.look_aheads(weights, velocities, decays, lambda_tichonov, alpha, nesterov)
+        output = self.forward(layers, workspace)
+        self.kernels.momentum_update(weights, velocities, decays, tuple(workspace.inputs), tuple(workspace.net_values), tuple(workspace.outputs), tuple(workspace.deltas), tuple(workspace.gradients),
+                                     y, *self.activations(layers), eta, alpha, nesterov)
+        return output
+
+backends = {"numpy": NumpyBackend, "numba": NumbaBackend}
+
+def get_backend(name):
+    return backends[name]()
+
+def available_backends():
+    available = []
+    for name in backends:
+        try:
+            get_backend(name)
+            available.append(name)
+        except ImportError:
+            pass
+    return available
+
+# Largest absolute differences between the outputs and the gradients that
+# each backend computes for the same network and standardized batch, with
+# respect to the first one. The network's backend is restored afterwards.
+def check_parity(network, X_std, y_std, names = None):
+    names = names or available_backends()
+    backend = network.backend
+    results = []
+    try:
+        for name in names:
+            network.backend = get_backend(name)
+            workspace = network.workspace(len(X_std))
+            output = np.copy(network.train_batch_output(X_std, workspace))
+            gradients = [np.copy(gradient) for gradient in network.backpropagation_full_batch(X_std, y_std)]
+            results.append((output, gradients))
+    finally:
+        network.backend = backend
+    reference_output, reference_gradients = results[0]
+    return {
+        name: {
+            "output": float(np.max(np.abs(output - reference_output))),
+            "gradients": max(float(np.max(np.abs(gradient - reference))) for gradient, reference in zip(gradients, reference_gradients))
+        }
+        for name, (output, gradients) in zip(names, results)
+    }
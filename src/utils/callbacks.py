@@ -0,0 +1,84 @@
+import json
+import time
+
+# Accumulates the time spent in each phase of an epoch: lap(phase) charges the
+# time elapsed since the previous lap (or start) to phase.
+class Timer:
+
+    phases = ["forward", "backward", "update", "evaluation"]
+
+    def start(self):
+        self.times = dict.fromkeys(self.phases, 0.0)
+        self.begin = self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.times[phase] += now - self.last
+        self.last = now
+
+    def total(self):
+        return time.perf_counter() - self.begin
+
+# Base class of the hooks called by Network.backpropagation_batch. Returning
+# True from on_epoch_end stops the training after that epoch. on_train_begin
+# is called at the start of every backpropagation_batch call, so that one
+# instance can be reused across trainings.
+class Callback:
+
+    def on_train_begin(self, network):
+        pass
+
+    def on_epoch_start(self, network, epoch):
+        pass
+
+    def on_batch(self, network, epoch, batch, samples):
+        pass
+
+    def on_epoch_end(self, network, epoch, logs):
+        pass
+
+    def on_stop(self, network, epoch, reason):
+        pass
+
+# Writes one JSON object per event, with the per phase timings of every epoch.
+class JsonLinesLogger(Callback):
+
+    def __init__(self, filename, every = 1):
+        self.filename = filename
+        self.every = every
+
+    def write(self, event):
+        with open(self.filename, "a") as f:
+            f.write(json.dumps(event, default=float) + "\n")
+
+    def on_epoch_end(self, network, epoch, logs):
+        if epoch % self.every == 0:
+            self.write({"event": "epoch_end", "seed": network.seed, "epoch": epoch, **logs})
+
+    def on_stop(self, network, epoch, reason):
+        self.write({"event": "stop", "seed": network.seed, "epoch": epoch, "reason": reason})
+
+# Stops the training once monitor, a key of the epoch logs, has not improved
+# for patience epochs. By default it monitors the MSE on the other data when
+# there is some and the training MSE otherwise.
+class EarlyStopping(Callback):
+
+    def __init__(self, patience = 20, monitor = None):
+        self.patience = patience
+        self.monitor = monitor
+
+    def on_train_begin(self, network):
+        self.best = None
+        self.wait = 0
+
+    def on_epoch_end(self, network, epoch, logs):
+        monitor = self.monitor or ("MSE_other" if "MSE_other" in logs else "MSE")
+        if monitor not in logs:
+            raise KeyError(f"EarlyStopping monitors {monitor}, which is not one of the logs {sorted(logs)}")
+        value = logs[monitor]
+        if self.best is None or value < self.best:
+            self.best = value
+            self.wait = 0
+        else:
+            self.wait += 1
+        return self.wait >= self.patience
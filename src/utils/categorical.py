@@ -0,0 +1,81 @@
+import numpy as np
+
+# Categorical inputs kept as integer codes: codes[i, a] is the value of
+# attribute a in sample i, between 0 and cardinalities[a] - 1. The dataset
+# stands for its one-hot encoding, whose columns are the values of the first
+# attribute, then those of the second and so on (the order of pd.get_dummies),
+# and np.asarray gives that dense matrix. The first layer of a network uses the
+# codes directly: a pre-activation is the sum of one weight column per
+# attribute and the gradient is scattered back into those columns.
+class Categorical:
+
+    # widest encoding, in columns per attribute, whose gradient uses the
+    # one-hot matrix instead of scattering
+    dense_ratio = 16
+
+    def __init__(self, codes, cardinalities, columns = None):
+        self.codes = np.asarray(codes, dtype=np.intp)
+        self.cardinalities = list(cardinalities)
+        self.width = int(sum(self.cardinalities))
+        # column of every code in the biased weight matrix, after the bias column
+        if columns is None:
+            columns = self.codes + np.concatenate(([1], np.cumsum(self.cardinalities)[:-1] + 1)).astype(np.intp)
+        self.columns = columns
+        self.flat_columns = columns.ravel()
+        self.shape = (len(self.codes), self.width)
+        self.dense = None
+
+    # the one-hot matrix is a cache, rebuilt where it is needed
+    def __getstate__(self):
+        return dict(self.__dict__, dense=None)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, indexes):
+        return Categorical(self.codes[indexes], self.cardinalities, self.columns[indexes])
+
+    def to_dense(self, dtype = float):
+        dense = np.zeros(self.shape, dtype=dtype)
+        np.put_along_axis(dense, self.columns - 1, 1, axis=1)
+        return dense
+
+    def __array__(self, dtype = None, copy = None):
+        return self.to_dense(dtype or float)
+
+    # pre-activation (neurons, samples) of a layer with the given biased weights
+    def net(self, weight_matrix, out):
+        np.copyto(out, weight_matrix[:, self.columns].sum(axis=-1))
+        out += weight_matrix[:, :1]
+        return out
+
+    # gradient of the biased weights from the layer's delta (neurons, samples).
+    # Narrow encodings, like the Monk one, take it as the product of delta
+    # with the one-hot matrix, which BLAS computes faster than any scatter.
+    # Wide ones scatter it with one bincount per neuron, whose output row stays
+    # in cache: one bincount or np.add.at over all the neurons at once is
+    # slower, as their output is not.
+    def gradient(self, delta, out):
+        attributes = self.codes.shape[1]
+        if self.width <= self.dense_ratio * attributes:
+            np.matmul(delta, self.one_hot(delta.dtype), out=out[:, 1:])
+        else:
+            for neuron in range(len(out)):
+                out[neuron, 1:] = np.bincount(self.flat_columns, np.repeat(delta[neuron], attributes), self.width + 1)[1:]
+        np.sum(delta, axis=1, out=out[:, 0])
+        return out
+
+    # the one-hot matrix, built once per dtype
+    def one_hot(self, dtype):
+        if self.dense is None or self.dense.dtype != dtype:
+            self.dense = self.to_dense(dtype)
+        return self.dense
+
+    # codes of a DataFrame of categorical columns, with the values of every
+    # column numbered in increasing order over all the given frames
+    @staticmethod
+    def from_frames(*frames):
+        columns = frames[0].columns
+        values = [np.unique(np.concatenate([frame[column].to_numpy() for frame in frames])) for column in columns]
+        encoded = [Categorical(np.stack([np.searchsorted(values[a], frame[column].to_numpy()) for a, column in enumerate(columns)], axis=1), [len(v) for v in values]) for frame in frames]
+        return encoded
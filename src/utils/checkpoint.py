@@ -0,0 +1,73 @@
+import json
+import os
+from utils.Neural_Network import *
+
+# Binary checkpoint layout: MAGIC, the header length as a little endian uint64,
+# a JSON header describing the network and the arrays, then the raw arrays,
+# each one starting on an ALIGNMENT boundary so it can be memory-mapped.
+MAGIC = b"NNCKPT01"
+ALIGNMENT = 64
+
+def checkpoint_path(filename):
+    return "Weights/" + filename + ".net"
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def save_checkpoint(network, filename):
+    arrays = [("layer_" + str(i), layer.weight_matrix) for i, layer in enumerate(network.trainable_layers())]
+    arrays += [(key, np.atleast_1d(np.asarray(value, dtype=network.dtype))) for key, value in network.std_mean.items()]
+    header = {
+        "layers": [network.input_layer.neurons] + [layer.neurons for layer in network.trainable_layers()],
+        "activations": [type(x).__name__ for x in network.activation_class_arr],
+        "dtype": network.dtype.str,
+        "seed": network.seed,
+        "arrays": []
+    }
+    offset = 0
+    for name, array in arrays:
+        header["arrays"].append({"name": name, "shape": list(array.shape), "offset": offset})
+        offset = align(offset + array.nbytes)
+    encoded_header = json.dumps(header).encode()
+    data_start = align(len(MAGIC) + 8 + len(encoded_header))
+    with open(checkpoint_path(filename), "wb") as f:
+        f.write(MAGIC)
+        f.write(len(encoded_header).to_bytes(8, "little"))
+        f.write(encoded_header)
+        for entry, (name, array) in zip(header["arrays"], arrays):
+            f.seek(data_start + entry["offset"])
+            f.write(np.ascontiguousarray(array, dtype=network.dtype).tobytes())
+
+def read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a network checkpoint")
+        length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(length))
+    return header, align(len(MAGIC) + 8 + length)
+
+# The arrays are mapped copy-on-write: loading only touches the pages that are
+# used and a loaded network can still be trained without changing the file.
+def load_checkpoint(filename):
+    path = checkpoint_path(filename)
+    header, data_start = read_header(path)
+    dtype = np.dtype(header["dtype"])
+    arrays = {}
+    for entry in header["arrays"]:
+        arrays[entry["name"]] = np.memmap(path, dtype=dtype, mode="c", offset=data_start + entry["offset"], shape=tuple(entry["shape"]))
+    layers = header["layers"]
+    network = Network(0.7, len(layers) - 2, layers[0], layers[1:], [get_activation(x) for x in header["activations"]], header["seed"], dtype)
+    for i, layer in enumerate(network.trainable_layers()):
+        layer.weight_matrix = arrays["layer_" + str(i)]
+    for key in network.std_mean:
+        network.std_mean[key] = arrays[key]
+    return network
+
+def checkpoint_exists(filename):
+    return os.path.exists(checkpoint_path(filename))
+
+# Converts a checkpoint written by Network.save_net, whose architecture has to
+# be given since the text format does not store it.
+def convert_text_weights(network, filename):
+    network.load_weights(filename)
+    save_checkpoint(network, filename)
@@ -0,0 +1,62 @@
+from concurrent.futures import ProcessPoolExecutor
+from utils.Neural_Network import *
+from utils.shared_data import *
+
+# Index arrays of the K folds, shuffled again for every repetition.
+def k_fold_splits(l, k, repeats = 1, seed = None):
+    rng = np.random.default_rng(seed)
+    splits = []
+    for _ in range(repeats):
+        folds = np.array_split(rng.permutation(l), k)
+        for i in range(k):
+            splits.append((np.concatenate(folds[:i] + folds[i + 1:]), folds[i]))
+    return splits
+
+def fold_statistics(data, splits):
+    X = np.asarray(data[0], dtype=float)
+    y = targets(data[1])
+    statistics = []
+    for training_indexes, _ in splits:
+        statistics.append({
+            "X_mean": X[training_indexes].mean(axis=0),
+            "X_std": X[training_indexes].std(axis=0, ddof=1),
+            "y_mean": y[training_indexes].mean(axis=0),
+            "y_std": y[training_indexes].std(axis=0, ddof=1)
+        })
+    return statistics
+
+def fold_task(network, data_handle, split, std_mean, regression, mean, tollerance, max_epochs, combinations, batch_size):
+    X, y = attach(data_handle)
+    training_indexes, validation_indexes = split
+    network.std_mean = std_mean
+    results = network.backpropagation_stacked([X[training_indexes], y[training_indexes]], regression, mean, False, tollerance, max_epochs, combinations, [X[validation_indexes], y[validation_indexes]], batch_size)
+    # training and validation task error, training and validation MSE of every combination
+    return np.array([[task_t_error[-1], task_v_error[-1], loss_t_error[-1], loss_v_error[-1]] for loss_t_error, loss_v_error, task_t_error, task_v_error in results])
+
+# K-fold (repeated when repeats > 1) cross validation of every combination of
+# eta_range x lambda_tichonov_range x alpha_range, one process per fold, all
+# folds starting from the current weights of network. The combination with the
+# lowest mean validation error (highest mean accuracy in classification) is the
+# best one.
+def cross_validation(network, data, k, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_tichonov_range, alpha_range, repeats = 1, seed = None, batch_size = None):
+    combinations = [[current_eta, current_lambda_tichonov, current_alpha] for current_eta in eta_range for current_lambda_tichonov in lambda_tichonov_range for current_alpha in alpha_range]
+    splits = k_fold_splits(len(data[0]), k, repeats, seed)
+    if standardization:
+        statistics = fold_statistics(data, splits)
+    else:
+        statistics = [dict(network.std_mean) for _ in splits]
+    with SharedDatasets(data) as (data_handle,), ProcessPoolExecutor() as executor:
+        futures = [executor.submit(fold_task, network, data_handle, split, std_mean, regression, mean, tollerance, max_epochs, combinations, batch_size) for split, std_mean in zip(splits, statistics)]
+        fold_errors = np.array([future.result() for future in futures])
+    mean_errors = fold_errors.mean(axis=0)
+    best_comb = int(np.argmin(mean_errors[:, 1]) if regression else np.argmax(mean_errors[:, 1]))
+    return {
+        "combinations": combinations,
+        "fold_errors": fold_errors,
+        "mean": mean_errors,
+        "std": fold_errors.std(axis=0),
+        "best_comb": best_comb,
+        "best_model": combinations[best_comb],
+        "validation_error": np.round(mean_errors[best_comb, 1], 4),
+        "training_error": np.round(mean_errors[best_comb, 0], 4)
+    }
@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import numpy as np
+
+# Learning curves are stored as small .npz files, Curves/<folder>/<filename>.npz,
+# while training and drawn later by render_curves into the matching
+# Plot/<folder>/<filename>.png, so training processes never load matplotlib.
+CURVES = "Curves"
+
+def curve_path(folder, filename, root = CURVES):
+    return os.path.join(root, folder, filename + ".npz") if folder else os.path.join(root, filename + ".npz")
+
+def save_curves(errors, other_errors = None, other_label = None, folder = None, filename = None):
+    path = curve_path(folder, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        np.savez(f, errors=np.asarray(errors, dtype=float), other_errors=np.asarray(other_errors if other_errors else [], dtype=float), other_label=np.array(other_label or ""))
+    os.replace(temporary, path)
+
+# Shows the figure right away when show is set, since only the calling process
+# can open its window, and otherwise only stores the curves.
+def show_or_save_curves(errors, other_errors = None, other_label = None, folder = None, filename = None, show = False):
+    if show:
+        from utils.plot import plot_error
+        plot_error(errors, other_errors, other_label, folder, filename, True, True)
+    else:
+        save_curves(errors, other_errors, other_label, folder, filename)
+
+# Draws every stored curve whose figure is missing or older than the curve,
+# all in the calling process.
+def render_curves(root = CURVES, force = False):
+    from utils.plot import plot_error
+    rendered = 0
+    for directory, _, files in os.walk(root):
+        for name in sorted(files):
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(directory, name)
+            folder = os.path.relpath(directory, root)
+            folder = None if folder == "." else folder
+            filename = name[:-len(".npz")]
+            figure = os.path.join("Plot", folder, filename + ".png") if folder else os.path.join("Plot", filename + ".png")
+            if not force and os.path.exists(figure) and os.path.getmtime(figure) >= os.path.getmtime(path):
+                continue
+            os.makedirs(os.path.dirname(figure), exist_ok=True)
+            with np.load(path) as curves:
+                other_errors = list(curves["other_errors"]) or None
+                plot_error(list(curves["errors"]), other_errors, str(curves["other_label"]) or None, folder, filename, True, False)
+            rendered += 1
+    return rendered
+
+def render_headless(root = CURVES):
+    os.environ["HEADLESS"] = "1"
+    import matplotlib
+    matplotlib.use("Agg")
+    return render_curves(root)
+
+# Renders in a separate process, which the interpreter joins on exit. A
+# process runs one renderer at a time: the previous one, if any, is joined
+# first so that two of them never draw the same stale figures.
+renderer = None
+
+def render_in_background(root = CURVES):
+    global renderer
+    if renderer is not None:
+        renderer.join()
+    renderer = multiprocessing.Process(target=render_headless, args=(root,))
+    renderer.start()
+    return renderer
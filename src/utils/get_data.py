@@ -1,6 +1,91 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
 import pandas as pd
+from utils.categorical import Categorical
+
+# Parsed datasets are kept in CACHE, one folder per dataset named after the
+# hash of its source files, with every frame saved as a .npy file. Later loads
+# memory-map those files, so parallel trials share the same pages instead of
+# parsing the CSVs again; changing a source file changes the folder name.
+CACHE = "Dataset/Cache"
+
+def source_hash(name, sources):
+    h = hashlib.sha256(name.encode())
+    for source in sources:
+        with open(source, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()[:16]
+
+def save_frames(folder, frames):
+    temporary = f"{folder}.{os.getpid()}.tmp"
+    os.makedirs(temporary, exist_ok=True)
+    description = {}
+    for key, frame in frames.items():
+        np.save(os.path.join(temporary, key + ".npy"), frame.to_numpy())
+        description[key] = {"name": frame.name} if isinstance(frame, pd.Series) else {"columns": list(frame.columns)}
+    with open(os.path.join(temporary, "frames.json"), "w") as f:
+        json.dump(description, f)
+    try:
+        os.rename(temporary, folder)
+    except OSError:
+        # another process stored the same dataset first
+        shutil.rmtree(temporary, ignore_errors=True)
+        wait_for_frames(folder)
+
+def wait_for_frames(folder, timeout = 60, poll = 0.1):
+    deadline = time.time() + timeout
+    while not os.path.exists(os.path.join(folder, "frames.json")):
+        if time.time() > deadline:
+            raise TimeoutError(f"{folder} was not stored within {timeout} seconds")
+        time.sleep(poll)
+
+# True for the finished cache folders of the dataset name, whatever their hash:
+# the temporary folders of processes still writing (<folder>.<pid>.tmp) are not.
+def is_cache_folder(entry, name):
+    prefix, _, digest = entry.rpartition("-")
+    return prefix == name and len(digest) == 16 and all(c in "0123456789abcdef" for c in digest)
+
+def load_frames(folder):
+    with open(os.path.join(folder, "frames.json"), "r") as f:
+        description = json.load(f)
+    frames = {}
+    for key, entry in description.items():
+        array = np.load(os.path.join(folder, key + ".npy"), mmap_mode="r")
+        if "columns" in entry:
+            frames[key] = pd.DataFrame(array, columns=entry["columns"], copy=False)
+        else:
+            frames[key] = pd.Series(array, name=entry["name"], copy=False)
+    return frames
+
+# Returns the frames built by parse from the sources, parsing them only if
+# they are not in the cache yet.
+def cached_frames(name, sources, parse):
+    folder = os.path.join(CACHE, name + "-" + source_hash(name, sources))
+    if not os.path.exists(os.path.join(folder, "frames.json")):
+        os.makedirs(CACHE, exist_ok=True)
+        for old in os.listdir(CACHE):
+            if is_cache_folder(old, name) and old != os.path.basename(folder):
+                shutil.rmtree(os.path.join(CACHE, old), ignore_errors=True)
+        save_frames(folder, parse())
+    return load_frames(folder)
 
 def get_data_monk(id, encoding):
+    sources = ["Dataset/Monk/monks-" + str(id) + ".train", "Dataset/Monk/monks-" + str(id) + ".test"]
+    frames = cached_frames("monks-" + str(id) + ("-encoded" if encoding else ""), sources, lambda: parse_monk(id, encoding))
+    return [frames["X"], frames["y"]], [frames["test_X"], frames["test_y"]]
+
+# Monk data with the categorical features kept as integer codes, which stand
+# for the same one-hot columns get_data_monk(id, True) gives.
+def get_data_monk_codes(id):
+    [X, y], [test_X, test_y] = get_data_monk(id, False)
+    X, test_X = Categorical.from_frames(X, test_X)
+    return [X, y], [test_X, test_y]
+
+def parse_monk(id, encoding):
     data = pd.read_csv("Dataset/Monk/monks-" + str(id) + ".train",sep = "\s+", header=None) 
     test_data = pd.read_csv("Dataset/Monk/monks-" + str(id) + ".test", sep = "\s+", header=None)
 
@@ -19,15 +104,23 @@ def get_data_monk(id, encoding):
     if encoding:
         X = pd.get_dummies(X, dtype=float, columns=[f'feature{i}' for i in range(1, n_colonne - 1)])
         test_X = pd.get_dummies(test_X, dtype=float, columns=[f"feature{i}" for i in range(1, n_colonne - 1)])
-    return [X, y], [test_X, test_y]
+    return {"X": X, "y": y, "test_X": test_X, "test_y": test_y}
 
-def hold_out_cup(train_perc, validation_perc):
+def get_data_cup():
+    frames = cached_frames("ML-CUP24-TR", ["Dataset/Cup/ML-CUP24-TR.csv"], parse_cup)
+    return [frames["X"], frames["y"]]
+
+def parse_cup():
     data = pd.read_csv("Dataset/Cup/ML-CUP24-TR.csv", sep=",", header=None, comment="#")
     n_colonne = data.shape[1]
     colonne = ['datanumber'] + [f'feature{i}' for i in range(1, n_colonne - 3)] + ['target_x', 'target_y', 'target_z']
     data.columns = colonne
     X = data.drop(columns=["datanumber", 'target_x', 'target_y', 'target_z']) 
     y = data[["target_x", "target_y", "target_z"]]
+    return {"X": X, "y": y}
+
+def hold_out_cup(train_perc, validation_perc):
+    X, y = get_data_cup()
     l = len(X)
     train_size = int(train_perc * l)
     X_train = X.iloc[:train_size]
@@ -40,9 +133,12 @@ def hold_out_cup(train_perc, validation_perc):
     return [X_train, y_train], [X_val, y_val], [X_test, y_test]
 
 def get_blind_TS():
+    return cached_frames("ML-CUP24-TS", ["Dataset/Cup/ML-CUP24-TS.csv"], parse_blind_TS)["X"]
+
+def parse_blind_TS():
     data = pd.read_csv("Dataset/Cup/ML-CUP24-TS.csv", sep=",", header=None, comment="#")
     n_colonne = data.shape[1]
     colonne = ['datanumber'] + [f'feature{i}' for i in range(1, n_colonne)]
     data.columns = colonne
     X = data.drop(columns=["datanumber"])
-    return X
\ No newline at end of file
+    return {"X": X}
\ No newline at end of file
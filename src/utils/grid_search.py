@@ -1,22 +1,30 @@
 from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+import os
 import time
 from utils.Neural_Network import *
+from utils.shared_data import *
+from utils.curves import render_in_background
+from utils.results import ResultStore
 
 def write_result(network, net_name, best_comb, best_model, best_validation_error, training_error):
-    with open("Grid_search/" + net_name + "_grid_search.txt", "a") as f:
-        f.write(f"\n|\t{best_comb}\t\t|\t{best_model}\t|\t{best_validation_error}\t|\t{training_error}\t"
-                f"|\t{network.seed}\t|\t{[network.hidden_layers[i].neurons for i in range(network.depth)] + [network.output_layer.neurons]}\t"
-                f"|\t{list(map(lambda x: type(x).__name__, network.activation_class_arr))}\t|\n")
-    f.close()
+    ResultStore().add_grid_result(network, net_name, best_comb, best_model, best_validation_error, training_error)
 
-def grid_search_iteration(networks, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_range, alpha_range, prefixes):
+def headless_worker():
+    os.environ["HEADLESS"] = "1"
+
+def internal_grid_search_task(network, training_handle, validation_handle, *args):
+    return network.internal_grid_search(attach(training_handle), attach(validation_handle), *args)
+
+def grid_search_iteration(networks, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_range, alpha_range, prefixes, cache = None, min_epochs = None, stacked = False, optimizer = Nesterov):
+    if cache and min_epochs:
+        raise ValueError("successive halving (min_epochs) does not use the result cache")
     start = time.time()
     best_result = None 
     network_index = None
 
-    with ProcessPoolExecutor() as executor:
+    with SharedDatasets(training_data, validation_data) as (training_handle, validation_handle), ProcessPoolExecutor(initializer=headless_worker) as executor:
         futures = {
-            executor.submit(network.internal_grid_search, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_range, alpha_range, prefix, False): i
+            executor.submit(internal_grid_search_task, network, training_handle, validation_handle, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_range, alpha_range, False, None, cache, min_epochs, 3, stacked, False, 1, optimizer): i
             for i, (network, prefix) in enumerate(zip(networks, prefixes))
         }
 
@@ -44,16 +52,20 @@ def grid_search_iteration(networks, training_data, validation_data, regression,
         write_result(networks[index], prefixes[index], result[0], result[1], result[2], result[3])
         print(f"({networks[index].seed}) Result for network {prefixes[index]}: (val) {result[2]}, (train) {result[3]} params: {result[1]} (combination {result[0]})")  # Debug
 
+    # the workers only stored their learning curves, draw them while the next
+    # stage trains
+    render_in_background()
+
     end = time.time()
     print(f"Single grid elapsed time: {round((end - start) / 60, 2)} minutes")
 
     return network_index, best_result[1], best_result[2]
 
-def grid_search(networks, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_range, alpha_range, prefixes):
+def grid_search(networks, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_range, alpha_range, prefixes, cache = None, min_epochs = None, stacked = False, optimizer = Nesterov):
 
     start = time.time()
     
-    coarse_network_index, coarse_params, _ = grid_search_iteration(networks, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_range, alpha_range, prefixes)
+    coarse_network_index, coarse_params, _ = grid_search_iteration(networks, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, eta_range, lambda_range, alpha_range, prefixes, cache, min_epochs, stacked, optimizer)
 
     seed = networks[coarse_network_index].seed
 
@@ -73,7 +85,7 @@ def grid_search(networks, training_data, validation_data, regression, mean, stan
     refined_alpha_range = [round(coarse_params[2] + 0.05, 2), coarse_params[2], round(coarse_params[2] - 0.05, 2)]
     refined_prefixes = ["refined_0", "refined_1", "refined_2"]
 
-    refined_network_index, refined_params, validation_error = grid_search_iteration(networks, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, refined_eta_range, refined_lambda_range, refined_alpha_range, refined_prefixes)
+    refined_network_index, refined_params, validation_error = grid_search_iteration(networks, training_data, validation_data, regression, mean, standardization, tollerance, max_epochs, refined_eta_range, refined_lambda_range, refined_alpha_range, refined_prefixes, cache, min_epochs, stacked, optimizer)
 
     end = time.time()
 
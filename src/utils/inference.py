@@ -0,0 +1,134 @@
+import pandas as pd
+from utils.Neural_Network import *
+
+def read_chunks(path, chunk_size):
+    return pd.read_csv(path, sep=",", header=None, comment="#", chunksize=chunk_size)
+
+# Streams a blind test set (ID, INPUTS) through the network chunk by chunk and
+# writes "ID,outputs" lines after the header, so memory only depends on chunk_size.
+def predict_csv(network, input_path, output_path, header = None, chunk_size = 10000):
+    with open(output_path, "w") as f:
+        for line in header or []:
+            f.write(line + "\n")
+        for chunk in read_chunks(input_path, chunk_size):
+            result = pd.DataFrame(network.predict(chunk.iloc[:, 1:].to_numpy()))
+            result.insert(0, "id", chunk.iloc[:, 0].to_numpy())
+            result.to_csv(f, header=False, index=False, lineterminator="\n")
+
+# Inference-only copy of a trained network. The input standardization is
+# folded into the first layer and, when the output activation is the identity,
+# the output de-standardization into the output layer, so a layer is a single
+# X @ weights + bias followed by its activation. The arrays are contiguous,
+# read-only and stored as (inputs, neurons) so rows go through without
+# transposes.
+class FrozenNetwork:
+
+    def __init__(self, weights, biases, activations, y_scale = None, y_shift = None):
+        self.weights = [self.freeze_array(weight_matrix) for weight_matrix in weights]
+        self.biases = [self.freeze_array(bias) for bias in biases]
+        self.activations = list(activations)
+        self.functions = [get_activation(name).activation() for name in self.activations]
+        self.y_scale = None if y_scale is None else self.freeze_array(y_scale)
+        self.y_shift = None if y_shift is None else self.freeze_array(y_shift)
+
+    @staticmethod
+    def freeze_array(array):
+        array = np.ascontiguousarray(array)
+        array.setflags(write=False)
+        return array
+
+    def predict(self, X):
+        output = np.atleast_2d(np.asarray(X, dtype=self.weights[0].dtype))
+        for weight_matrix, bias, function in zip(self.weights, self.biases, self.functions):
+            output = np.matmul(output, weight_matrix)
+            output += bias
+            function(output, output)
+        if self.y_scale is not None:
+            output *= self.y_scale
+            output += self.y_shift
+        return output
+
+    def network_output(self, input):
+        return self.predict(input)[0]
+
+    def save(self, filename):
+        arrays = {f"weights_{i}": weight_matrix for i, weight_matrix in enumerate(self.weights)}
+        arrays.update({f"bias_{i}": bias for i, bias in enumerate(self.biases)})
+        if self.y_scale is not None:
+            arrays.update(y_scale=self.y_scale, y_shift=self.y_shift)
+        np.savez("Weights/" + filename + ".frozen.npz", activations=np.array(self.activations), **arrays)
+
+    @staticmethod
+    def load(filename):
+        with np.load("Weights/" + filename + ".frozen.npz") as arrays:
+            layers = len(arrays["activations"])
+            return FrozenNetwork([arrays[f"weights_{i}"] for i in range(layers)], [arrays[f"bias_{i}"] for i in range(layers)], [str(name) for name in arrays["activations"]],
+                                 arrays["y_scale"] if "y_scale" in arrays else None, arrays["y_shift"] if "y_shift" in arrays else None)
+
+def freeze(network):
+    dtype = network.dtype
+    X_mean = np.asarray(network.std_mean["X_mean"], dtype=float)
+    X_std = np.asarray(network.std_mean["X_std"], dtype=float)
+    y_mean = np.asarray(network.std_mean["y_mean"], dtype=float) * np.ones(network.output_layer.neurons)
+    y_std = np.asarray(network.std_mean["y_std"], dtype=float) * np.ones(network.output_layer.neurons)
+    weights, biases = [], []
+    for layer in network.trainable_layers():
+        weight_matrix = np.asarray(layer.weight_matrix, dtype=float)
+        weights.append(weight_matrix[:, 1:].T)
+        biases.append(weight_matrix[:, 0])
+    # W ((x - mean) / std) + b = (W / std) x + (b - W (mean / std))
+    biases[0] = biases[0] - weights[0].T @ (X_mean / X_std * np.ones(weights[0].shape[0]))
+    weights[0] = weights[0] / (X_std * np.ones(weights[0].shape[0]))[:, np.newaxis]
+    activations = [type(x).__name__ for x in network.activation_class_arr]
+    y_scale = y_shift = None
+    if activations[-1] == "Id":
+        weights[-1] = weights[-1] * y_std
+        biases[-1] = biases[-1] * y_std + y_mean
+    elif not (np.all(y_std == 1) and np.all(y_mean == 0)):
+        y_scale, y_shift = y_std.astype(dtype), y_mean.astype(dtype)
+    return FrozenNetwork([w.astype(dtype) for w in weights], [b.astype(dtype) for b in biases], activations, y_scale, y_shift)
+
+# Networks with the same architecture (e.g. one per seed) evaluated together:
+# the frozen weights of the members are stacked into (members, inputs, neurons)
+# arrays, so one batched forward pass gives the output of every member.
+class Ensemble:
+
+    def __init__(self, members):
+        members = [member if isinstance(member, FrozenNetwork) else freeze(member) for member in members]
+        if len({(tuple(member.activations), tuple(weight_matrix.shape for weight_matrix in member.weights)) for member in members}) != 1:
+            raise ValueError("the members of an ensemble must have the same architecture")
+        self.weights = [FrozenNetwork.freeze_array(np.stack(layer)) for layer in zip(*[member.weights for member in members])]
+        self.biases = [FrozenNetwork.freeze_array(np.stack(layer)[:, np.newaxis]) for layer in zip(*[member.biases for member in members])]
+        self.functions = members[0].functions
+        scaled = [member.y_scale is not None for member in members]
+        self.y_scale = self.y_shift = None
+        if any(scaled):
+            ones, zeros = np.ones(members[0].biases[-1].shape), np.zeros(members[0].biases[-1].shape)
+            self.y_scale = np.stack([member.y_scale if member.y_scale is not None else ones for member in members])[:, np.newaxis]
+            self.y_shift = np.stack([member.y_shift if member.y_shift is not None else zeros for member in members])[:, np.newaxis]
+
+    def __len__(self):
+        return len(self.weights[0])
+
+    # outputs of every member, (members, samples, outputs)
+    def predict_members(self, X):
+        output = np.atleast_2d(np.asarray(X, dtype=self.weights[0].dtype))
+        for weight_matrix, bias, function in zip(self.weights, self.biases, self.functions):
+            output = np.matmul(output, weight_matrix)
+            output += bias
+            function(output, output)
+        if self.y_scale is not None:
+            output *= self.y_scale
+            output += self.y_shift
+        return output
+
+    # mean prediction of the members and their standard deviation
+    def predict_with_spread(self, X):
+        outputs = self.predict_members(X)
+        return outputs.mean(axis=0), outputs.std(axis=0)
+
+    def predict(self, X):
+        return self.predict_members(X).mean(axis=0)
+
+    def network_output(self, input):
+        return self.predict(input)[0]
@@ -0,0 +1,102 @@
+import numpy as np
+from numba import njit
+
+# The matrix products go to BLAS through numba's np.dot, which calls it by the
+# function pointers of scipy.linalg.cython_blas: without scipy the module does
+# not load and available_backends() leaves the numba backend out.
+try:
+    import scipy.linalg.cython_blas
+except ImportError as e:
+    raise ImportError("the numba backend needs scipy for the matrix products") from e
+
+# Kernels of the numba backend. The activations themselves are left to the
+# vectorized NumPy functions of the Function classes; the kernels only apply
+# their derivatives, identified by the codes in ACTIVATION_CODES with the
+# slope a of the Function class. The layers of a network are passed as tuples
+# of arrays (weights, biased inputs, pre-activations, outputs, deltas,
+# gradients), so that the backward pass and the update run in one compiled
+# call instead of one NumPy call per operation.
+ACTIVATION_CODES = {"Id": 0, "Relu": 1, "Sigmoid": 2, "Tanh": 3}
+
+# multiplies delta by the derivative of the activation, in place
+@njit(cache=True)
+def scale_by_derivate(delta, net_value, output, code, a):
+    for i in range(delta.shape[0]):
+        for j in range(delta.shape[1]):
+            if code == 1:
+                if net_value[i, j] <= 0:
+                    delta[i, j] = 0
+            elif code == 2:
+                delta[i, j] *= output[i, j] * (1 - output[i, j])
+            elif code == 3:
+                delta[i, j] *= a * (1 - output[i, j] * output[i, j]) / 2
+
+# delta of a layer from the delta of the next one, skipping the bias column
+# of next_weight_matrix; the derivative is applied by the caller
+@njit(cache=True)
+def layer_delta(next_weight_matrix, next_delta, delta):
+    np.dot(np.ascontiguousarray(next_weight_matrix[:, 1:]).T, next_delta, delta)
+
+@njit(cache=True)
+def layer_gradient(delta, biased_input, gradient):
+    np.dot(delta, biased_input.T, gradient)
+
+# backward pass from the residual (target - output) in deltas[-1]
+@njit(cache=True)
+def backward(weights, inputs, net_values, outputs, deltas, gradients, codes, slopes, input_gradient):
+    last = len(weights) - 1
+    scale_by_derivate(deltas[last], net_values[last], outputs[last], codes[last], slopes[last])
+    layer_gradient(deltas[last], inputs[last], gradients[last])
+    for i in range(last - 1, -1, -1):
+        layer_delta(weights[i + 1], deltas[i + 1], deltas[i])
+        scale_by_derivate(deltas[i], net_values[i], outputs[i], codes[i], slopes[i])
+        if i > 0 or input_gradient:
+            layer_gradient(deltas[i], inputs[i], gradients[i])
+
+# residual (outputs, samples) of the targets y (samples, outputs)
+@njit(cache=True)
+def residual(y, output, delta):
+    for i in range(delta.shape[0]):
+        for j in range(delta.shape[1]):
+            delta[i, j] = y[j, i] - output[i, j]
+
+# Weight update kernels of the velocity based optimizers, the same operations
+# as Nesterov and Momentum in utils.optimizers: the decay is taken from the
+# weights before the look-ahead moves them.
+@njit(cache=True)
+def look_ahead(weight_matrix, velocity, decay, lambda_tichonov, alpha, nesterov):
+    for i in range(weight_matrix.shape[0]):
+        for k in range(weight_matrix.shape[1]):
+            decay[i, k] = weight_matrix[i, k] * lambda_tichonov
+            if nesterov:
+                velocity[i, k] *= alpha
+                weight_matrix[i, k] += velocity[i, k]
+
+@njit(cache=True)
+def update(weight_matrix, gradient, velocity, decay, eta, alpha, nesterov):
+    for i in range(weight_matrix.shape[0]):
+        for k in range(weight_matrix.shape[1]):
+            step = gradient[i, k] * eta
+            if nesterov:
+                weight_matrix[i, k] += step
+                velocity[i, k] += step
+            else:
+                velocity[i, k] = velocity[i, k] * alpha + step
+                weight_matrix[i, k] += velocity[i, k]
+            weight_matrix[i, k] -= decay[i, k]
+
+@njit(cache=True)
+def look_aheads(weights, velocities, decays, lambda_tichonov, alpha, nesterov):
+    for i in range(len(weights)):
+        look_ahead(weights[i], velocities[i], decays[i], lambda_tichonov, alpha, nesterov)
+
+# Second half of a full-batch step of Nesterov (nesterov = True) or classical
+# momentum, after look_aheads and the forward pass: residual, backward pass
+# and update.
+@njit(cache=True)
+def momentum_update(weights, velocities, decays, inputs, net_values, outputs, deltas, gradients, y, codes, slopes, eta, alpha, nesterov):
+    last = len(weights) - 1
+    residual(y, outputs[last], deltas[last])
+    backward(weights, inputs, net_values, outputs, deltas, gradients, codes, slopes, True)
+    for i in range(len(weights)):
+        update(weights[i], gradients[i], velocities[i], decays[i], eta, alpha, nesterov)
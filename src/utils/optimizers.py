@@ -0,0 +1,111 @@
+from abc import ABC, abstractmethod
+import numpy as np
+
+# Weight update rules used by the training loops. An optimizer keeps its state
+# in arrays shaped like the weight matrices, allocated once and updated in
+# place; the weights can also be stacks of configurations (k, out, in) with
+# eta and alpha of shape (k, 1, 1). The gradients are the descent directions
+# returned by backpropagation and are overwritten by update. alpha is the
+# momentum coefficient of every rule (beta1 for Adam).
+class Optimizer(ABC):
+
+    buffers = []
+    # the normalized rules divide the gradient by its running magnitude, so
+    # eta is a step size and is not divided by the batch size
+    normalized = False
+
+    def __init__(self, weights):
+        self.state = {name: [np.zeros_like(weight_matrix) for weight_matrix in weights] for name in self.buffers}
+        self.steps = 0
+
+    # moves the weights before the gradient is computed
+    def look_ahead(self, weights, alpha):
+        pass
+
+    @abstractmethod
+    def update(self, weights, gradients, eta, alpha):
+        pass
+
+    # keeps only the stacked configurations selected by keep
+    def select(self, keep):
+        for name, arrays in self.state.items():
+            self.state[name] = [array[keep] for array in arrays]
+
+# Nesterov momentum: the gradient is taken at the weights moved by the
+# momentum. This is the update the network has always used.
+class Nesterov(Optimizer):
+
+    buffers = ["velocity"]
+
+    def look_ahead(self, weights, alpha):
+        for weight_matrix, velocity in zip(weights, self.state["velocity"]):
+            velocity *= alpha
+            weight_matrix += velocity
+
+    def update(self, weights, gradients, eta, alpha):
+        for weight_matrix, gradient, velocity in zip(weights, gradients, self.state["velocity"]):
+            gradient *= eta
+            weight_matrix += gradient
+            velocity += gradient
+
+# Classical (heavy ball) momentum, with the gradient taken at the current weights.
+class Momentum(Optimizer):
+
+    buffers = ["velocity"]
+
+    def update(self, weights, gradients, eta, alpha):
+        for weight_matrix, gradient, velocity in zip(weights, gradients, self.state["velocity"]):
+            velocity *= alpha
+            gradient *= eta
+            velocity += gradient
+            weight_matrix += velocity
+
+class RMSProp(Optimizer):
+
+    buffers = ["velocity", "square", "scratch"]
+    normalized = True
+    rho = 0.9
+    epsilon = 1e-8
+
+    def update(self, weights, gradients, eta, alpha):
+        for weight_matrix, gradient, velocity, square, scratch in zip(weights, gradients, self.state["velocity"], self.state["square"], self.state["scratch"]):
+            square *= self.rho
+            np.multiply(gradient, gradient, out=scratch)
+            scratch *= 1 - self.rho
+            square += scratch
+            np.sqrt(square, out=scratch)
+            scratch += self.epsilon
+            gradient /= scratch
+            gradient *= eta
+            velocity *= alpha
+            velocity += gradient
+            weight_matrix += velocity
+
+class Adam(Optimizer):
+
+    buffers = ["moment", "square", "scratch"]
+    normalized = True
+    beta2 = 0.999
+    epsilon = 1e-8
+
+    def update(self, weights, gradients, eta, alpha):
+        self.steps += 1
+        step = eta * np.sqrt(1 - self.beta2 ** self.steps) / (1 - np.power(alpha, self.steps))
+        for weight_matrix, gradient, moment, square, scratch in zip(weights, gradients, self.state["moment"], self.state["square"], self.state["scratch"]):
+            moment *= alpha
+            np.multiply(gradient, 1 - alpha, out=scratch)
+            moment += scratch
+            square *= self.beta2
+            np.multiply(gradient, gradient, out=scratch)
+            scratch *= 1 - self.beta2
+            square += scratch
+            np.sqrt(square, out=gradient)
+            gradient += self.epsilon
+            np.divide(moment, gradient, out=gradient)
+            gradient *= step
+            weight_matrix += gradient
+
+optimizers = {optimizer.__name__: optimizer for optimizer in [Nesterov, Momentum, RMSProp, Adam]}
+
+def get_optimizer(name):
+    return optimizers[name]
@@ -1,8 +1,22 @@
-import networkx as nx
+import os
 import numpy as np
-import matplotlib.pyplot as plt
+import matplotlib
 import pandas as pd
 
+# with HEADLESS=1 figures are only rendered to files through the Agg backend
+# and no GUI toolkit is ever loaded
+if os.environ.get("HEADLESS") == "1":
+    matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+
+# Writes the current figure through a temporary file, so that a renderer in
+# another process never leaves or reads a half written image.
+def save_figure(path):
+    temporary = f"{path}.{os.getpid()}.tmp.png"
+    plt.savefig(temporary)
+    os.replace(temporary, path)
+
 def plot_error(errors, other_errors = None, other_label = None, folder = None, filename = None, save = True, show = False):
     plot = plt.figure(figsize=(8, 6))
     plt.plot(range(len(errors)), errors, c='blue', label='Train')
@@ -15,24 +29,16 @@ def plot_error(errors, other_errors = None, other_label = None, folder = None, f
     plt.legend()
     if folder and filename:
         if save:
-            plt.savefig("Plot/" + folder + "/" + filename + ".png")
+            save_figure("Plot/" + folder + "/" + filename + ".png")
     elif filename:
         if save:
-            plt.savefig("Plot/" + filename + ".png")
+            save_figure("Plot/" + filename + ".png")
     if show:
         plt.show()
     plt.close()
 
 def plot_output(network, X, y = None, filename = "", save = False, show = False):
-    data = []
-    for i in range(len(X)):
-        output = pd.Series(network.network_output(X.iloc[i]))
-        data.append({
-            'target_x': output.iloc[0],
-            'target_y': output.iloc[1],
-            'target_z': output.iloc[2],
-        })
-    data = pd.DataFrame(data)
+    data = pd.DataFrame(network.predict(X), columns=['target_x', 'target_y', 'target_z'])
     fig = plt.figure(figsize=(9, 9))
     ax = fig.add_subplot(111, projection='3d')
     
@@ -68,7 +74,8 @@ def plot_output(network, X, y = None, filename = "", save = False, show = False)
     plt.close()
 
 def plot(network, filename):
-    
+    import networkx as nx
+
     def weight_to_color (x):
         return [0, 0, 1] if x < 0 else [1, 0, 0]
 
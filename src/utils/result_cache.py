@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# On-disk cache of grid search runs. Every configuration is stored as soon as
+# it has been trained, in a file named after the hash of everything that
+# determines its result, so an interrupted sweep resumes from the first
+# configuration that was not completed. Files are touched when read and the
+# least recently used ones are removed once the folder exceeds max_bytes.
+# The folder is only scanned for that on the first put, every scan_every puts
+# (to see what other processes stored) and when the size of the folder at the
+# last scan, plus what was stored since, exceeds max_bytes. Eviction then
+# frees evict_to of max_bytes, so that the next scans are not at every put.
+class ResultCache:
+
+    curves = ["loss_t_error", "loss_v_error", "task_t_error", "task_v_error"]
+    evict_to = 0.9
+
+    def __init__(self, folder = "Cache", max_bytes = 2 * 1024**3, scan_every = 100):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.scan_every = scan_every
+        self.size = None
+        self.puts = 0
+
+    def digest(self, network, training_data, validation_data, *settings):
+        h = hashlib.sha256()
+        for array in list(training_data) + list(validation_data):
+            array = np.ascontiguousarray(array, dtype=float)
+            h.update(str(array.shape).encode())
+            h.update(array.tobytes())
+        # the initial weights stand for the seed and the global random state they were drawn with
+        for layer in network.trainable_layers():
+            h.update(np.ascontiguousarray(layer.weight_matrix).tobytes())
+        description = {
+            "layers": [network.input_layer.neurons] + [layer.neurons for layer in network.trainable_layers()],
+            "activations": [type(x).__name__ for x in network.activation_class_arr],
+            "dtype": network.dtype.str,
+            "seed": network.seed,
+            "settings": settings
+        }
+        h.update(json.dumps(description, default=str).encode())
+        return h.hexdigest()
+
+    def key(self, digest, eta, lambda_tichonov, alpha):
+        return hashlib.sha256(json.dumps([digest, eta, lambda_tichonov, alpha]).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder, key + ".npz")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with np.load(path) as entry:
+                result = tuple(list(entry[name]) for name in self.curves)
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return result
+
+    def put(self, key, result):
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(key)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, **{name: np.asarray(curve, dtype=float) for name, curve in zip(self.curves, result)})
+            written = f.tell()
+        os.replace(temporary, path)
+        self.puts += 1
+        if self.size is None or self.puts % self.scan_every == 0:
+            self.evict()
+        else:
+            self.size += written
+            if self.size > self.max_bytes:
+                self.evict()
+
+    # Removes the least recently used files, if the folder exceeds max_bytes,
+    # until it fits in evict_to of it; files that another process removes
+    # first are skipped.
+    def evict(self):
+        entries = []
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if name.endswith(".npz"):
+                try:
+                    stat = os.stat(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        size = sum(entry[1] for entry in entries)
+        limit = self.max_bytes * self.evict_to if size > self.max_bytes else self.max_bytes
+        for _, entry_size, name in sorted(entries):
+            if size <= limit:
+                break
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        self.size = size
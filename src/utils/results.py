@@ -0,0 +1,158 @@
+import ast
+import json
+import os
+import sqlite3
+
+# SQLite store of the grid search and trial results, replacing the text files
+# that were appended to and parsed again on every lookup. Every call opens its
+# own connection, so a store can be passed to pool workers; the database runs
+# in WAL mode and writers wait for the lock instead of failing.
+class ResultStore:
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS grid_search (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            seed INTEGER,
+            layers TEXT NOT NULL,
+            activations TEXT NOT NULL,
+            combination INTEGER,
+            eta REAL,
+            lambda_tichonov REAL,
+            alpha REAL,
+            validation_error REAL,
+            training_error REAL
+        );
+        CREATE INDEX IF NOT EXISTS grid_search_configuration ON grid_search (seed, layers, eta, lambda_tichonov, alpha);
+        CREATE TABLE IF NOT EXISTS trials (
+            id INTEGER PRIMARY KEY,
+            seed INTEGER NOT NULL,
+            training_error REAL,
+            validation_error REAL,
+            test_error REAL,
+            layers TEXT NOT NULL,
+            activations TEXT NOT NULL,
+            eta REAL,
+            lambda_tichonov REAL,
+            alpha REAL
+        );
+        CREATE INDEX IF NOT EXISTS trials_seed ON trials (seed);
+        CREATE TABLE IF NOT EXISTS imports (
+            filename TEXT PRIMARY KEY
+        );
+    """
+
+    # legacy_trials is the old text file of the trials, imported the first
+    # time a store is opened on the database.
+    def __init__(self, path = "results.db", timeout = 60, legacy_trials = "trials.txt"):
+        self.path = path
+        self.timeout = timeout
+        connection = self.connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(self.schema)
+        finally:
+            connection.close()
+        if legacy_trials is not None and os.path.exists(legacy_trials):
+            self.import_trials(legacy_trials)
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    def write(self, query, rows):
+        connection = self.connect()
+        try:
+            with connection:
+                connection.executemany(query, rows)
+        finally:
+            connection.close()
+
+    def read(self, query, parameters = ()):
+        connection = self.connect()
+        try:
+            return connection.execute(query, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def add_grid_result(self, network, name, combination, params, validation_error, training_error):
+        layers = [layer.neurons for layer in network.hidden_layers] + [network.output_layer.neurons]
+        activations = [type(x).__name__ for x in network.activation_class_arr]
+        self.write("INSERT INTO grid_search (name, seed, layers, activations, combination, eta, lambda_tichonov, alpha, validation_error, training_error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                   [(name, network.seed, json.dumps(layers), json.dumps(activations), combination, *params, validation_error, training_error)])
+
+    insert_trial = "INSERT INTO trials (seed, training_error, validation_error, test_error, layers, activations, eta, lambda_tichonov, alpha) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+    @staticmethod
+    def trial_row(res):
+        return (res["seed"], res["training_error"], res["validation_error"], res["test_error"], json.dumps(res["network"]), json.dumps(res["activation_class"]), *res["params"])
+
+    def add_trials(self, results):
+        self.write(self.insert_trial, [self.trial_row(res) for res in results])
+
+    # The most recent trial of seed, as the dictionaries given to add_trials.
+    def trial(self, seed):
+        rows = self.read("SELECT seed, training_error, validation_error, test_error, layers, activations, eta, lambda_tichonov, alpha FROM trials WHERE seed = ? ORDER BY id DESC LIMIT 1", (seed,))
+        if not rows:
+            return None
+        seed, training_error, validation_error, test_error, layers, activations, eta, lambda_tichonov, alpha = rows[0]
+        return {
+            "seed": seed,
+            "training_error": training_error,
+            "validation_error": validation_error,
+            "test_error": test_error,
+            "network": json.loads(layers),
+            "activation_class": json.loads(activations),
+            "params": [eta, lambda_tichonov, alpha]
+        }
+
+    # Mean and (population) variance of the errors of the most recent trial
+    # of every seed, as {"training": (mean, var), "validation": ..., "test": ...}.
+    def mean_var(self, seeds):
+        if not seeds:
+            raise ValueError("no seeds given")
+        missing = sorted(set(seeds) - {seed for seed, in self.read(f"SELECT DISTINCT seed FROM trials WHERE seed IN ({', '.join('?' * len(seeds))})", list(seeds))})
+        if missing:
+            raise KeyError(f"no trials of the seeds {missing}")
+        placeholders = ", ".join("?" * len(seeds))
+        averages = ", ".join(f"AVG({error}), AVG({error} * {error}) - AVG({error}) * AVG({error})" for error in ["training_error", "validation_error", "test_error"])
+        row = self.read(f"SELECT {averages} FROM trials WHERE id IN (SELECT MAX(id) FROM trials WHERE seed IN ({placeholders}) GROUP BY seed)", list(seeds))[0]
+        return {"training": row[0:2], "validation": row[2:4], "test": row[4:6]}
+
+    def best_grid_results(self, seed = None, limit = 10):
+        query = "SELECT name, seed, layers, activations, eta, lambda_tichonov, alpha, validation_error, training_error FROM grid_search"
+        parameters = []
+        if seed is not None:
+            query += " WHERE seed = ?"
+            parameters.append(seed)
+        return self.read(query + " ORDER BY validation_error LIMIT ?", parameters + [limit])
+
+    # Imports the records of the old trials.txt format, once: the file name is
+    # recorded in the same transaction, so importing it again adds nothing.
+    # Returns the number of trials added.
+    def import_trials(self, filename = "trials.txt"):
+        key = os.path.abspath(filename)
+        if self.read("SELECT 1 FROM imports WHERE filename = ?", (key,)):
+            return 0
+        with open(filename, "r") as f:
+            lines = [line for line in f.read().splitlines() if line.strip()]
+        results = []
+        for errors, description in zip(lines[0::2], lines[1::2]):
+            fields = dict(field.split(": ", 1) for field in (errors + "\t" + description).split("\t"))
+            results.append({
+                "seed": int(fields["seed"]),
+                "training_error": float(fields["training_error"]),
+                "validation_error": float(fields["validation_error"]),
+                "test_error": float(fields["test_error"]),
+                "network": ast.literal_eval(fields["network"]),
+                "activation_class": ast.literal_eval(fields["activation_function"]),
+                "params": ast.literal_eval(fields["params"])
+            })
+        connection = self.connect()
+        try:
+            with connection:
+                if connection.execute("INSERT OR IGNORE INTO imports (filename) VALUES (?)", (key,)).rowcount == 0:
+                    return 0
+                connection.executemany(self.insert_trial, [self.trial_row(res) for res in results])
+        finally:
+            connection.close()
+        return len(results)
@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# Datasets are written once as .npy files (in RAM backed /dev/shm when it is
+# available) and every worker maps the same pages read-only, so only the
+# small SharedArray handles are pickled for each task.
+class SharedArray:
+
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        self.shape = shape
+        self.dtype = dtype
+
+    def attach(self):
+        return np.load(self.path, mmap_mode="r")
+
+class SharedDatasets:
+
+    def __init__(self, *datasets):
+        self.datasets = datasets
+        self.folder = None
+
+    def publish(self, array, name):
+        array = np.ascontiguousarray(array, dtype=float)
+        path = os.path.join(self.folder, name + ".npy")
+        np.save(path, array)
+        return SharedArray(path, array.shape, array.dtype.str)
+
+    def __enter__(self):
+        self.folder = tempfile.mkdtemp(prefix="datasets_", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        return [[self.publish(array, f"{i}_{j}") for j, array in enumerate(dataset)] for i, dataset in enumerate(self.datasets)]
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+def attach(dataset):
+    return [array.attach() for array in dataset]
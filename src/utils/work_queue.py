@@ -0,0 +1,234 @@
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from utils import get_data
+from utils.Neural_Network import *
+
+# Job queue of a grid search sweep, kept in an SQLite database that the
+# coordinator and every worker open by path: workers on other hosts only need
+# the database on a shared filesystem (one with working file locks). A job is
+# one (architecture, seed, eta, lambda, alpha) training run. Workers lease a
+# job for lease_seconds and renew the lease while they train, so the job of a
+# worker that dies goes back to the queue once its lease expires.
+class WorkQueue:
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS sweeps (
+            name TEXT PRIMARY KEY,
+            settings TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            sweep TEXT NOT NULL,
+            job TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (sweep, status);
+    """
+
+    # jobs whose lease expired after max_attempts are failed, not reclaimed
+    expire_leases = "UPDATE jobs SET status = 'failed', result = ? WHERE status = 'leased' AND lease_until < ? AND attempts >= ?"
+
+    def __init__(self, path = "queue.db", lease_seconds = 60, max_attempts = 3, timeout = 60):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        connection = self.connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(self.schema)
+        finally:
+            connection.close()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def execute(self, query, parameters = ()):
+        connection = self.connect()
+        try:
+            return connection.execute(query, parameters).fetchall()
+        finally:
+            connection.close()
+
+    # Adds the jobs of a sweep, unless a sweep with that name is already in
+    # the queue: enqueueing again resumes it.
+    def enqueue(self, sweep, settings, jobs):
+        connection = self.connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            if connection.execute("SELECT 1 FROM sweeps WHERE name = ?", (sweep,)).fetchall():
+                connection.execute("ROLLBACK")
+                return False
+            connection.execute("INSERT INTO sweeps (name, settings) VALUES (?, ?)", (sweep, json.dumps(settings)))
+            connection.executemany("INSERT INTO jobs (sweep, job) VALUES (?, ?)", [(sweep, json.dumps(job)) for job in jobs])
+            connection.execute("COMMIT")
+            return True
+        finally:
+            connection.close()
+
+    # Leases the first pending job, or one whose lease expired, to worker.
+    # A job whose lease expired after max_attempts is marked failed instead.
+    # Returns (id, job, settings) or None when there is nothing to do now.
+    def claim(self, worker):
+        connection = self.connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            connection.execute(self.expire_leases, (json.dumps({"error": "lease expired"}), now, self.max_attempts))
+            rows = connection.execute("SELECT jobs.id, jobs.job, sweeps.settings FROM jobs JOIN sweeps ON jobs.sweep = sweeps.name "
+                                      "WHERE jobs.status = 'pending' OR (jobs.status = 'leased' AND jobs.lease_until < ? AND jobs.attempts < ?) ORDER BY jobs.id LIMIT 1",
+                                      (now, self.max_attempts)).fetchall()
+            if not rows:
+                connection.execute("COMMIT")
+                return None
+            id, job, settings = rows[0]
+            connection.execute("UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?", (worker, now + self.lease_seconds, id))
+            connection.execute("COMMIT")
+            return id, json.loads(job), json.loads(settings)
+        finally:
+            connection.close()
+
+    # Extends the lease, returning False if the job is no longer leased to worker.
+    def renew(self, id, worker):
+        connection = self.connect()
+        try:
+            cursor = connection.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'leased'", (time.time() + self.lease_seconds, id, worker))
+            return cursor.rowcount == 1
+        finally:
+            connection.close()
+
+    def complete(self, id, worker, result):
+        self.execute("UPDATE jobs SET status = 'done', worker = ?, result = ? WHERE id = ? AND status != 'done'", (worker, json.dumps(result), id))
+
+    # Puts the job back in the queue, or marks it failed after max_attempts.
+    def fail(self, id, worker, error):
+        self.execute("UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, result = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                     (self.max_attempts, json.dumps({"error": error}), id, worker))
+
+    # Fails the jobs whose lease expired after max_attempts, so that a sweep
+    # whose workers all died still finishes.
+    def expire(self):
+        self.execute(self.expire_leases, (json.dumps({"error": "lease expired"}), time.time(), self.max_attempts))
+
+    # Number of jobs by status, of one sweep or of the whole queue.
+    def counts(self, sweep = None):
+        if sweep is None:
+            rows = self.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        else:
+            rows = self.execute("SELECT status, COUNT(*) FROM jobs WHERE sweep = ? GROUP BY status", (sweep,))
+        return dict(rows)
+
+    def results(self, sweep):
+        return [(json.loads(job), json.loads(result)) for job, result in self.execute("SELECT job, result FROM jobs WHERE sweep = ? AND status = 'done' ORDER BY id", (sweep,))]
+
+# Training and validation data of a sweep: settings["data"] names a function
+# of utils.get_data and its arguments, whose first two results are those.
+def load_data(settings):
+    return getattr(get_data, settings["data"][0])(*settings["data"][1])[:2]
+
+# Trains the network of a job on the sweep's training and validation data.
+def run_job(job, settings, training_data, validation_data):
+    np.random.seed(job["seed"])
+    layers = job["layers"]
+    network = Network(settings["weight_range"], len(layers) - 1, training_data[0].shape[1], layers, [get_activation(name) for name in job["activations"]], job["seed"])
+    start = time.time()
+    MSE_errors, MSE_validation_errors, task_errors, task_validation_errors = network.backpropagation_batch(
+        training_data, settings["regression"], settings["mean"], settings["standardization"], settings["tollerance"], settings["max_epochs"],
+        job["eta"], job["lambda_tichonov"], job["alpha"], validation_data, settings.get("batch_size"), optimizer=get_optimizer(settings.get("optimizer", "Nesterov")))
+    return {
+        "validation_error": float(task_validation_errors[-1]),
+        "training_error": float(task_errors[-1]),
+        "validation_MSE": float(MSE_validation_errors[-1]),
+        "training_MSE": float(MSE_errors[-1]),
+        "epochs": len(MSE_errors),
+        "seconds": time.time() - start
+    }
+
+def renew_lease(queue, id, worker, done):
+    while not done.wait(queue.lease_seconds / 3):
+        if not queue.renew(id, worker):
+            return
+
+# Runs jobs until the queue has none left pending or leased. Start it on any
+# host that sees the database, e.g. python src/sweep.py worker --queue <path>.
+# The data of every sweep is loaded once per worker.
+def run_worker(path, worker = None, poll = 1, lease_seconds = 60):
+    queue = WorkQueue(path, lease_seconds)
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    os.environ["HEADLESS"] = "1"
+    datasets = {}
+    completed = 0
+    while True:
+        claimed = queue.claim(worker)
+        if claimed is None:
+            counts = queue.counts()
+            if not counts.get("pending") and not counts.get("leased"):
+                return completed
+            time.sleep(poll)
+            continue
+        id, job, settings = claimed
+        done = threading.Event()
+        heartbeat = threading.Thread(target=renew_lease, args=(queue, id, worker, done), daemon=True)
+        heartbeat.start()
+        try:
+            data = json.dumps(settings["data"])
+            if data not in datasets:
+                datasets[data] = load_data(settings)
+            result = run_job(job, settings, *datasets[data])
+        except Exception as e:
+            queue.fail(id, worker, repr(e))
+        else:
+            queue.complete(id, worker, result)
+            completed += 1
+        finally:
+            done.set()
+            heartbeat.join()
+
+def sweep_jobs(architectures, seeds, eta_range, lambda_tichonov_range, alpha_range):
+    return [{"layers": layers, "activations": activations, "seed": seed, "eta": eta, "lambda_tichonov": lambda_tichonov, "alpha": alpha}
+            for layers, activations in architectures for seed in seeds
+            for eta in eta_range for lambda_tichonov in lambda_tichonov_range for alpha in alpha_range]
+
+# Coordinator: enqueues every (architecture, seed, eta, lambda, alpha) job of
+# the sweep, starts local_workers worker processes on this host (others can
+# join from other hosts) and waits for the sweep to finish. Returns the done
+# jobs with their results, best first by validation error (or accuracy).
+# Raises RuntimeError if a local worker crashes or a job failed; the results
+# of the done jobs stay in the queue (WorkQueue(path).results(name)).
+def run_sweep(path, name, settings, architectures, seeds, eta_range, lambda_tichonov_range, alpha_range, local_workers = 0, poll = 1, lease_seconds = 60):
+    queue = WorkQueue(path, lease_seconds)
+    queue.enqueue(name, settings, sweep_jobs(architectures, seeds, eta_range, lambda_tichonov_range, alpha_range))
+    workers = [multiprocessing.Process(target=run_worker, args=(path, None, poll, lease_seconds)) for _ in range(local_workers)]
+    for process in workers:
+        process.start()
+    while True:
+        queue.expire()
+        counts = queue.counts(name)
+        if not counts.get("pending") and not counts.get("leased"):
+            break
+        crashed = [process.exitcode for process in workers if process.exitcode]
+        if crashed:
+            for process in workers:
+                process.terminate()
+                process.join()
+            raise RuntimeError(f"sweep {name}: local workers exited with codes {crashed}, run it again to resume")
+        time.sleep(poll)
+    for process in workers:
+        process.join()
+    crashed = [process.exitcode for process in workers if process.exitcode]
+    if crashed:
+        raise RuntimeError(f"sweep {name}: local workers exited with codes {crashed}")
+    failed = queue.execute("SELECT result FROM jobs WHERE sweep = ? AND status = 'failed' ORDER BY id", (name,))
+    if failed:
+        raise RuntimeError(f"sweep {name}: {len(failed)} jobs failed, the first with {json.loads(failed[0][0])['error']}")
+    sign = 1 if settings["regression"] else -1
+    return sorted(queue.results(name), key=lambda x: sign * x[1]["validation_error"])
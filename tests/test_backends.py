@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from utils.backends import available_backends, check_parity
+from utils.categorical import Categorical
+from utils.Neural_Network import *
+
+pytestmark = pytest.mark.skipif("numba" not in available_backends(), reason="the numba backend needs numba and scipy")
+
+# largest difference allowed between the backends
+TOLERANCE = {np.float64: 1e-10, np.float32: 1e-4}
+
+ACTIVATIONS = [(Tanh, Id), (Relu, Sigmoid)]
+
+def dataset(categorical, samples = 60, outputs = 2):
+    rng = np.random.default_rng(0)
+    if categorical:
+        cardinalities = [3, 2, 4]
+        X = Categorical(np.stack([rng.integers(0, c, samples) for c in cardinalities], axis=1), cardinalities)
+    else:
+        X = rng.normal(size=(samples, 5))
+    y = rng.normal(size=(samples, outputs))
+    return X, y
+
+def network(X, y, activations, dtype, backend, depth = 2, width = 8):
+    np.random.seed(1)
+    hidden, output = activations
+    return Network(0.7, depth, X.shape[1], [width] * depth + [y.shape[1]], [hidden() for _ in range(depth)] + [output()], 1, dtype, backend)
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+@pytest.mark.parametrize("activations", ACTIVATIONS)
+@pytest.mark.parametrize("categorical", [False, True])
+def test_passes_agree(dtype, activations, categorical):
+    X, y = dataset(categorical)
+    net = network(X, y, activations, dtype, "numpy")
+    X, y, X_std, y_std, _ = net.prepare_data([X, y], True)
+    for differences in check_parity(net, X_std, y_std, ["numpy", "numba"]).values():
+        assert differences["output"] < TOLERANCE[dtype]
+        assert differences["gradients"] < TOLERANCE[dtype]
+
+# Nesterov and Momentum run as one fused kernel, Adam through the passes
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+@pytest.mark.parametrize("optimizer", [Nesterov, Momentum, Adam])
+@pytest.mark.parametrize("categorical", [False, True])
+def test_training_agrees(dtype, optimizer, categorical):
+    X, y = dataset(categorical)
+    eta = 0.01 if optimizer is Adam else 0.1
+    errors, weights = [], []
+    for backend in ["numpy", "numba"]:
+        net = network(X, y, ACTIVATIONS[0], dtype, backend)
+        errors.append(net.backpropagation_batch([X, y], True, True, True, 0, 50, eta, 0.001, 0.5, [X, y], optimizer=optimizer))
+        weights.append([layer.weight_matrix for layer in net.trainable_layers()])
+    tolerance = TOLERANCE[dtype] * 100
+    for reference, value in zip(*errors):
+        np.testing.assert_allclose(value, reference, rtol=tolerance)
+    for reference, value in zip(*weights):
+        np.testing.assert_allclose(value, reference, rtol=tolerance, atol=tolerance)
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_predictions_agree(dtype):
+    X, y = dataset(False)
+    outputs = [network(X, y, ACTIVATIONS[1], dtype, backend).predict(X) for backend in ["numpy", "numba"]]
+    np.testing.assert_allclose(outputs[1], outputs[0], rtol=TOLERANCE[dtype], atol=TOLERANCE[dtype])
+
+# the derivatives applied by the kernels against the Function classes
+@pytest.mark.parametrize("activation", [Id, Relu, Sigmoid, Tanh])
+def test_derivatives_agree(activation):
+    from utils.numba_kernels import ACTIVATION_CODES, scale_by_derivate
+    net_value = np.linspace(-10, 10, 2001).reshape(1, -1)
+    output = activation().activation()(np.copy(net_value))
+    delta = np.random.default_rng(0).normal(size=net_value.shape)
+    expected = delta * activation().derivate()(net_value, output)
+    scale_by_derivate(delta, net_value, output, ACTIVATION_CODES[activation.__name__], float(getattr(activation, "a", 1)))
+    np.testing.assert_allclose(delta, expected, rtol=1e-15)
+
+def test_non_contiguous_weights_rejected():
+    X, y = dataset(False)
+    net = network(X, y, ACTIVATIONS[0], np.float64, "numba")
+    net.output_layer.weight_matrix = np.asfortranarray(net.output_layer.weight_matrix)
+    with pytest.raises(ValueError):
+        net.backpropagation_batch([X, y], True, True, True, 0, 1, 0.1, 0.001, 0.5)